@@ -1,74 +1,57 @@
 # Visual application for marketSim with shiny core
 from shiny import App, reactive, render, ui, module, Inputs, Outputs, Session
 # Python modules
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 # Project modules
-import supplySide as sup
-import products as prod
 import demandSide as dem
-import companies as comp
+import supplySide as sup
+import market as mk
+import plotCache as pc
+import profiling as prof
 
-# Create raw material objects with random supply pars
-print("Creating raw material objects and their supply curves")
+# Market settings, every browser session builds its own market from these in the server function
 matNameList = ["nqh345","nqa344","trm222","crystals","nanites"]
-matList = [sup.RawMaterial(s) for s in matNameList]
-for i in range(len(matList)):
-    matList[i].setRandomSupplyPars()
-    matList[i].printInfo()
-    print("\n --- \n")
-print("{0} raw material types are initialized".format(sup.RawMaterial.nRawMaterials))
-
-# Create product objects
-print("Creating product objects and their material requirements!")
 prodNameList = ["F302","X304","Viper","Starfury","Jumper"]
-prodList = [prod.Product(s,matNameList) for s in prodNameList]
-for i in range(len(prodList)):
-    prodList[i].setMaterialObjects(matList)
-    prodList[i].setRandomMaterialReqs()
-    prodList[i].printInfo()
-    print("\n --- \n")
-print("{0} product types are initialized".format(prod.Product.nProducts))
-
-
-
-
-# Create costumers
-costumerNameList = ["C{0}".format(i+1) for i in range(1000)]
-costumerList = [dem.Costumer(s, prodNameList) for s in costumerNameList]
-dem.Costumer.setRandomBudgetMean(25,5)
-for c in costumerList:
-    # Random initialization routine
-    c.setProductObjects(prodList)
-    c.setRandomTotalBudget()
-    c.setRandomProductProbabilities()
-    
-# Set values
+nCostumers = 1000
 testCompanyCapital = 100000
-#capitalPerProduct = np.ones(len(prodList))*(testCompanyCapital/len(prodList))
-capitalPerProduct = np.array([20000,20000,30000,20000,10000])
-testCompanyProfitPercentage = 5
-#plannedProfitPerProduct = np.ones(len(prodList))*testCompanyProfitPercentage
-plannedProfitPerProduct = np.array([5,10,5,1,3])
+marketSeed = 1
 
-# Create company and buy products
-testCompany = comp.Company("testCompany",prodNameList,matNameList,testCompanyCapital)
-testCompany.setMaterialObjects(matList)
-testCompany.setProductObjects(prodList)
-testCompany.softResetProductsAndMaterials()
-testCompany.setProductInvestments(capitalPerProduct)
-testCompany.setProductProfitPercentages(plannedProfitPerProduct)
-productArray, argTuple = testCompany.calcProductsFromInvestment()
-testCompany.makeProducts()
+# Rendered plot images shared by all sessions, keyed on the data they show
+plotImageCache = pc.ImageCache(maxEntries=64)
 
-# Reset costumers to start, and let them buy products
-for c in costumerList:
-    c.softReset()
-    c.buyProducts()
+# Background workers shared by all sessions for sell rounds and market randomization, so the event loop stays free
+simExecutor = ThreadPoolExecutor(max_workers=os.cpu_count())
 
-testCompany.calcProfits()
-testCompany.printInfo()
+# Progress and cancellation state shared between a session and its background job
+class TaskProgress:
+    def __init__(self):
+        self.value = 0.0
+        self.cancelEvent = threading.Event()
+    
+    # Called by the purchasing engine every round (in the worker thread), stops the round if the session cancelled it
+    def report(self, fraction):
+        if self.cancelEvent.is_set():
+            raise dem.PurchaseCancelled()
+        self.value = fraction
+    
+    def cancel(self):
+        self.cancelEvent.set()
+        
+# Run a market job in the executor while streaming its progress to a progress bar
+async def runWithProgress(session, message, job, taskProgress=None):
+    future = asyncio.get_running_loop().run_in_executor(simExecutor, job)
+    with ui.Progress(min=0, max=1, session=session) as p:
+        p.set(0, message=message)
+        while not future.done():
+            await asyncio.wait([future], timeout=0.2)
+            if taskProgress is not None:
+                p.set(taskProgress.value)
+    return await future
 
 # To be shown in the app in tables:
 # Function to init a constant valued data frame to be used as a table
@@ -79,41 +62,60 @@ def initTableDataFrame(columnNames,rowNames,initValue=0.0):
     tempDict = {k:v for (k,v) in zip(tempDict.keys(),tempVals)}
     return pd.DataFrame(tempDict)
 
+# Build a table data frame in one pass from per product arrays (one per column), with a total row at the end
+def makeTableDataFrame(columnNames,rowNames,columnArrays):
+    tempDict = {columnNames[0]:rowNames}
+    tempDict.update({c:np.append(columnArrays[c],np.sum(columnArrays[c])) for c in columnNames[1:]})
+    return pd.DataFrame(tempDict)
+
+# Copy of a table data frame with new values for some product rows and for whole columns, the total row is summed again
+def updateTableDataFrame(tableDf,columnNames,columnArrays,rows,columns=()):
+    newDf = tableDf.copy()
+    for c in columnNames[1:]:
+        if c in columns:
+            newDf[c] = np.append(columnArrays[c],np.sum(columnArrays[c]))
+        elif len(rows)>0:
+            newDf.loc[rows,c] = np.asarray(columnArrays[c])[rows]
+            newDf.loc[len(newDf)-1,c] = np.sum(newDf[c].iloc[:-1])
+    return newDf
+
+# Set a reactive value (data frame or plot key) only if it changed, so unchanged tables and plots are not sent to the browser again
+def setIfChanged(reactiveValue,newValue):
+    oldValue = reactiveValue()
+    unchanged = oldValue.equals(newValue) if isinstance(oldValue,pd.DataFrame) else oldValue==newValue
+    if not unchanged:
+        reactiveValue.set(newValue)
+
 # Init production plan data frame
 prodPlanColumns = ["Product Name","Invested","Produced","Cost Per Item","Price Per Item","Profit Per Sale", "Cost", "Price", "Expected Profit"]
 prodPlanRows = prodNameList + ["All products"]
-prodPlanDf = initTableDataFrame(prodPlanColumns,prodPlanRows,0.0)
 # Init product sales data frame
 prodSalesColumns = ["Product Name", "Produced", "Sold", "Remaining", "Expected Profit", "Actual Profit"]
 prodSalesRows = prodNameList + ["All products"]
-prodSalesDf = initTableDataFrame(prodSalesColumns,prodSalesRows,0.0)
 
 # Some functions for the app
 
-# To track changes in server function
-counter = reactive.Value()
-counter.set(0)
-
 # UI function for plots in materials tab
 @module.ui
 def materialPlotUi(matName):
-    return ui.nav_panel(matName, ui.output_plot("supplyCurve"))
-# server function for plots in materials tab
+    return ui.nav_panel(matName, ui.output_image("supplyCurve"))
+# server function for plots in materials tab, redrawn when the supply curve or demand of the material changes
 @module.server
-def materialPlotServer(input: Inputs, output: Outputs, session: Session, matNameIn):
+def materialPlotServer(input: Inputs, output: Outputs, session: Session, matNameIn, market, plotKey):
     @output
-    @render.plot
-    @reactive.event(counter)
+    @render.image
+    @reactive.event(plotKey)
     def supplyCurve(matName=matNameIn):       
-        f, ax = matList[matNameList.index(matName)].plotSupplyCurve()
-        return f
+        # Drawn from the values in the key, so the cached image always matches its key
+        key = plotKey()
+        return plotImageCache.getImage(key, lambda: sup.plotSupplyCurveFromPars(matName, key[2:5], key[5], key[6]))
 
 @module.ui
 def productInvestUi(pName):
     return ui.panel_well(
         ui.h1("Product: {0}".format(pName)),
         ui.row(
-            ui.column(5,ui.input_slider("inv","Investment",0,testCompany.totalCapital,0)),
+            ui.column(5,ui.input_slider("inv","Investment",0,testCompanyCapital,0)),
             ui.column(5,ui.input_slider("prof","Profit",0,100,0)),
         ),
     )
@@ -177,17 +179,22 @@ app_ui = ui.page_fluid(
         #Tab 4
         ui.nav_panel("Costumers",
             ui.row(
-                ui.column(6,ui.output_plot("budgetDist")),
+                ui.column(6,ui.output_image("budgetDist")),
                 ui.column(6,
                     ui.h5("Budget per Product"),
-                    ui.output_plot("productMarketShare"),
+                    ui.output_image("productMarketShare"),
                 ),
             ),
         ),
         #Tab 5
         ui.nav_panel("Control Panel",
             ui.h5("Generate new parameters for the simulation"),
+            ui.input_numeric("seed","Market Seed",value=1),
             ui.input_action_button("randomize","Generate Random Market"),
+            ui.h5("Time the simulation stages"),
+            ui.input_checkbox("profiling","Enable Profiling",value=False),
+            ui.input_action_button("refreshProfile","Refresh Profile"),
+            ui.output_text_verbatim("profileReport"),
         )
         
     ),
@@ -195,109 +202,141 @@ app_ui = ui.page_fluid(
 
 def server(input: Inputs, output: Outputs, session: Session):
     
+    # Market of this session, other sessions do not see its plan, sales or randomization
+    market = mk.Market(matNameList, prodNameList, nCostumers, testCompanyCapital, seed=marketSeed)
+    # Only one thread changes the session market at a time
+    marketLock = threading.Lock()
+    sellProgress = TaskProgress()
+    # To track changes of the session market (plots and requirements table)
+    counter = reactive.Value(0)
+    # Table contents of this session
+    prodPlanDf = reactive.Value(initTableDataFrame(prodPlanColumns,prodPlanRows,0.0))
+    prodSalesDf = reactive.Value(initTableDataFrame(prodSalesColumns,prodSalesRows,0.0))
+    # Keys of the data shown in the plots of this session
+    supplyCurveKeys = {m:reactive.Value(None) for m in matNameList}
+    budgetDistKey = reactive.Value(None)
+    marketShareKey = reactive.Value(None)
+    # Data of the budget plots taken together with their keys, so the images are drawn from the data the keys describe
+    plotData = {}
+    
+    # Recompute plot keys when the session market changed, plots are only redrawn if their key changed
+    @reactive.Effect
+    @reactive.event(counter)
+    def updatePlotKeys():
+        for m in market.matList:
+            setIfChanged(supplyCurveKeys[m.name], ("supplyCurve",m.name)+m.getSupplyPars()+(m.demanded,m.price))
+        population = market.population
+        # Keys from the precomputed budget statistics, so no pass over all costumers is needed
+        stats = population.budgetStats
+        edges, counts, productBudgets = stats.edges.copy(), stats.counts.copy(), stats.productBudgets.copy()
+        budgetKey = ("budgetDist",pc.arrayKey(edges,counts))
+        shareKey = ("marketShare",pc.arrayKey(productBudgets))+tuple(population.productNames)
+        plotData.clear()
+        plotData[budgetKey] = (edges, counts)
+        plotData[shareKey] = (list(population.productNames), productBudgets)
+        setIfChanged(budgetDistKey, budgetKey)
+        setIfChanged(marketShareKey, shareKey)
+    
     # Company Tab: Render total and remaining capitals
     @output
     @render.text
     @reactive.event(counter)
     def totalCap():
-        return "Total Capital: {0:.1f}$".format(testCompany.totalCapital)
+        return "Total Capital: {0:.1f}$".format(market.totalCapital)
     @output
     @render.text
     @reactive.event(counter)
     def remCap():
-        return "Remaining Capital: {0:.1f}$".format(testCompany.remCapital)
+        return "Remaining Capital: {0:.1f}$".format(market.remCapital)
     
 
     # Company Tab: Button effects for calculations
+    # Runs a job on the session market while holding its lock
+    # Jobs run in the executor, so waiting for the lock (a randomize job cannot be cancelled) never blocks the event loop
+    def lockedJob(job):
+        def run():
+            with marketLock:
+                return job()
+        return run
+    
     @reactive.Effect
     @reactive.event(input.butProdProp)
-    def updateInvestmentPlan():
-        # Call company functions
+    async def updateInvestmentPlan():
         inputTupleList = [productInvestServer(p) for p in prodNameList]
-        testCompany.setProductInvestments([i for (i,p) in inputTupleList])
-        testCompany.setProductProfitPercentages([p for (i,p) in inputTupleList])
-        productArray, argTuple = testCompany.calcProductsFromInvestment()
-        testCompany.makeProducts()
-        global prodPlanDf
-        #Update prodPlanDf (a bit inelegantly):
-        #prodPlanColumns = ["Product Name","Invested","Produced","Cost Per Item","Price Per Item","Profit Per Sale", "Cost", "Price", "Expected Profit"]
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[1]] = [testCompany.prodInvestDict[p] for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[1]] = sum([testCompany.prodInvestDict[p] for p in prodNameList])
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[2]] = [testCompany.prodCountDict[p] for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[2]] = sum([testCompany.prodCountDict[p] for p in prodNameList])
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[3]] = [testCompany.prodObjectDict[p].getMaterialCostPerItem() for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[3]] = sum([testCompany.prodObjectDict[p].getMaterialCostPerItem() for p in prodNameList])
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[4]] = [testCompany.prodObjectDict[p].getSellPrice() for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[4]] = sum([testCompany.prodObjectDict[p].getSellPrice() for p in prodNameList])
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[5]] = [testCompany.prodObjectDict[p].getProfit() for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[5]] = sum([testCompany.prodObjectDict[p].getProfit() for p in prodNameList])
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[6]] = [testCompany.prodObjectDict[p].getTotalMaterialCost() for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[6]] = sum([testCompany.prodObjectDict[p].getTotalMaterialCost() for p in prodNameList])
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[7]] = [testCompany.prodObjectDict[p].getPotTotalPrice() for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[7]] = sum([testCompany.prodObjectDict[p].getPotTotalPrice() for p in prodNameList])
-        prodPlanDf.loc[0:len(prodNameList)-1,prodPlanColumns[8]] = [testCompany.prodObjectDict[p].getPotTotalProfit() for p in prodNameList]
-        prodPlanDf.loc[len(prodNameList),prodPlanColumns[8]] = sum([testCompany.prodObjectDict[p].getPotTotalProfit() for p in prodNameList]) 
-    
+        # A running sell round is stopped (it stops at its next purchase round) before the plan changes
+        sellProgress.cancel()
+        # Only products depending on the changed sliders are solved again, and only their table rows are rewritten
+        def updateJob():
+            invalidation = market.updatePlan([i for (i,p) in inputTupleList],[p for (i,p) in inputTupleList])
+            return invalidation, market.getPlanArrays()
+        invalidation, planArrays = await runWithProgress(session, "Updating plan", lockedJob(updateJob))
+        expectedColumns = ["Expected Profit"] if invalidation.expectedSales else []
+        setIfChanged(prodPlanDf, updateTableDataFrame(prodPlanDf(),prodPlanColumns,planArrays,invalidation.getProductRows(),expectedColumns))
         counter.set(counter()+1)
     
+    # Sell round in the background, progress is shown while costumers buy
+    @reactive.extended_task
+    # The sales table values are read in the same locked job, so they match the round that was just sold
+    async def sellTask(taskProgress):
+        def sellJob():
+            market.sell(progress=taskProgress.report)
+            return market.getSalesArrays()
+        return await runWithProgress(session, "Selling products", lockedJob(sellJob), taskProgress)
+    
+    # Start a sell round, or cancel the running one if the button is clicked again
     @reactive.Effect
     @reactive.event(input.butSell)
-    def updateSales():
-        # Call functions for selling
-        for c in costumerList:
-            c.softReset()
-            c.buyProducts()
-        testCompany.calcProfits()
-        #Update data frame for sales and profit
-        global prodSalesDf
-        #prodSalesColumns = ["Product Name", "Produced", "Sold", "Remaining", "Expected Profit", "Actual Profit"]
-        prodSalesDf.loc[0:len(prodNameList)-1,prodSalesColumns[1]] = [testCompany.prodObjectDict[p].getProduced() for p in prodNameList]
-        prodSalesDf.loc[len(prodNameList),prodSalesColumns[1]] = sum([testCompany.prodObjectDict[p].getProduced() for p in prodNameList])
-        prodSalesDf.loc[0:len(prodNameList)-1,prodSalesColumns[2]] = [testCompany.prodObjectDict[p].getSales() for p in prodNameList]
-        prodSalesDf.loc[len(prodNameList),prodSalesColumns[2]] = sum([testCompany.prodObjectDict[p].getSales() for p in prodNameList])
-        prodSalesDf.loc[0:len(prodNameList)-1,prodSalesColumns[3]] = [testCompany.prodObjectDict[p].getRemaining() for p in prodNameList]
-        prodSalesDf.loc[len(prodNameList),prodSalesColumns[3]] = sum([testCompany.prodObjectDict[p].getRemaining() for p in prodNameList])
-        prodSalesDf.loc[0:len(prodNameList)-1,prodSalesColumns[4]] = [testCompany.prodObjectDict[p].getPotTotalProfit() for p in prodNameList]
-        prodSalesDf.loc[len(prodNameList),prodSalesColumns[4]] = sum([testCompany.prodObjectDict[p].getPotTotalProfit() for p in prodNameList])
-        prodSalesDf.loc[0:len(prodNameList)-1,prodSalesColumns[5]] = [testCompany.prodObjectDict[p].getTotalProfit() for p in prodNameList]
-        prodSalesDf.loc[len(prodNameList),prodSalesColumns[5]] = sum([testCompany.prodObjectDict[p].getTotalProfit() for p in prodNameList])
+    def startSales():
+        nonlocal sellProgress
+        if sellTask.status()=="running":
+            sellProgress.cancel()
+            return
+        sellProgress = TaskProgress()
+        sellTask.invoke(sellProgress)
         
-        counter.set(counter()+1)
+    # Update the sales table when a sell round finishes
+    @reactive.Effect
+    def updateSales():
+        status = sellTask.status()
+        with reactive.isolate():
+            if status=="success":
+                setIfChanged(prodSalesDf, makeTableDataFrame(prodSalesColumns,prodSalesRows,sellTask.result()))
+                counter.set(counter()+1)
+            elif status=="error":
+                try:
+                    sellTask.result()
+                except dem.PurchaseCancelled:
+                    # The market has already cleared the sales of the stopped round, so the table is cleared too
+                    setIfChanged(prodSalesDf, initTableDataFrame(prodSalesColumns,prodSalesRows,0.0))
+                    ui.notification_show("Sell round cancelled", type="warning")
+                except Exception as e:
+                    ui.notification_show("Sell round failed: {0}".format(e), type="error")
     
     @reactive.Effect
     @reactive.event(input.butReset)
-    def resetPlanAndSales():
+    async def resetPlanAndSales():
         # Soft reset material, product and costumer values
-        testCompany.softResetProductsAndMaterials()
-        testCompany.setCapital(testCompanyCapital)
-        for c in costumerList:
-            c.softReset()
+        sellProgress.cancel()
+        await runWithProgress(session, "Resetting market", lockedJob(market.softReset))
         # Reset data frames
-        global prodPlanDf
-        prodPlanDf = initTableDataFrame(prodPlanColumns,prodPlanRows,0.0)
-        global prodSalesDf
-        prodSalesDf = initTableDataFrame(prodSalesColumns,prodSalesRows,0.0)
+        setIfChanged(prodPlanDf, initTableDataFrame(prodPlanColumns,prodPlanRows,0.0))
+        setIfChanged(prodSalesDf, initTableDataFrame(prodSalesColumns,prodSalesRows,0.0))
         counter.set(counter()+1)
     
     # Company Tab: Render data frames as tables
     # Product Plan
     @output
     @render.data_frame
-    @reactive.event(counter)
     def prodPlanDfVis():
-        counter.set(0)
-        return render.DataTable(prodPlanDf.round(2))
-        # Product Plan
+        return render.DataTable(prodPlanDf().round(2))
+    # Product Sales
     @output
     @render.data_frame
-    @reactive.event(counter)
     def prodSalesDfVis():
-        counter.set(0)
-        pd.set_option("display.precision", 2)
-        return render.DataTable(prodSalesDf.round(2))
+        return render.DataTable(prodSalesDf().round(2))
     
     # Materials Tab: Plot material supply curves
-    [materialPlotServer(m,m) for m in matNameList]
+    [materialPlotServer(m,m,market,supplyCurveKeys[m]) for m in matNameList]
     
     #Products Tab: Show product requirements
     @output
@@ -305,54 +344,64 @@ def server(input: Inputs, output: Outputs, session: Session):
     @reactive.event(counter)
     def matReqDfVis():
         # Make a data frame for material requirements of products (For visualization in table form):
-        matReqDict = dict.fromkeys(["Material"]+prodNameList,[]) # Set keys
-        matReqVals = [matNameList] + [[p.materialDict[m] for m in matNameList] for p in prodList]
-        matReqDict = {k:v for (k,v) in zip(matReqDict.keys(),matReqVals)}
-        matReqDf = pd.DataFrame(matReqDict)
+        matReqDf = pd.DataFrame(market.getMaterialMatrix().T, columns=prodNameList)
+        matReqDf.insert(0,"Material",matNameList)
         return render.DataTable(matReqDf)
     
     #Costumers Tab: Plot costumer distributions:
     @output
-    @render.plot
-    @reactive.event(counter)
+    @render.image
+    @reactive.event(budgetDistKey)
     def budgetDist():
-        f, ax = dem.plotBudgetDist(costumerList)
-        return f
+        key = budgetDistKey()
+        return plotImageCache.getImage(key, lambda: dem.plotBudgetHistogram(*plotData[key]))
     
     @output
-    @render.plot
-    @reactive.event(counter)
+    @render.image
+    @reactive.event(marketShareKey)
     def productMarketShare():
-        f, ax = dem.plotBudgetPerProduct(costumerList)
-        return f
+        key = marketShareKey()
+        return plotImageCache.getImage(key, lambda: dem.plotProductBudgets(*plotData[key]))
     
     # Control Panel Tab: 
-    #randomize:
+    #randomize in the background:
+    @reactive.extended_task
+    async def randomizeTask(seed):
+        return await runWithProgress(session, "Generating market", lockedJob(lambda: market.randomize(seed)))
+    
     @reactive.Effect
     @reactive.event(input.randomize)
+    def startRandomize():
+        # Re-randomize materials, products and costumers from the seed (this also soft resets the market)
+        sellProgress.cancel()
+        randomizeTask.invoke(input.seed())
+    
+    # Reset the tables when the new market is ready
+    @reactive.Effect
     def generateNewParameters():
-        #First call soft reset
-        testCompany.softResetProductsAndMaterials()
-        testCompany.setCapital(testCompanyCapital)
-        # Now re-rerandomize:
-        for m in matList:
-            m.setRandomSupplyPars()
-        for p in prodList:
-            p.setRandomMaterialReqs()
-        dem.Costumer.setRandomBudgetMean(25,5)
-        for c in costumerList:
-            c.softReset()
-            c.setRandomTotalBudget()
-            c.setRandomProductProbabilities()
-        
-        # Inc counter state to alert other functions
-        counter.set(counter()+1)
+        if randomizeTask.status()!="success":
+            return
+        with reactive.isolate():
+            setIfChanged(prodPlanDf, initTableDataFrame(prodPlanColumns,prodPlanRows,0.0))
+            setIfChanged(prodSalesDf, initTableDataFrame(prodSalesColumns,prodSalesRows,0.0))
+            # Inc counter state to alert other functions
+            counter.set(counter()+1)
     
+    # Profiling is process wide, so the report covers the sessions running while it is enabled
+    @reactive.Effect
+    @reactive.event(input.profiling)
+    def toggleProfiling():
+        if input.profiling():
+            prof.reset()
+            prof.enable()
+        else:
+            prof.disable()
     
-
-        
+    @output
+    @render.text
+    @reactive.event(input.refreshProfile, input.profiling)
+    def profileReport():
+        return prof.formatReport() if prof.enabled else "Profiling is disabled"
     
 
 app = App(app_ui, server)
-
-
@@ -0,0 +1,168 @@
+# This file runs rival companies in one market: every company has investments, production and prices per product
+# All companies buy materials from the same supply curves, so material costs per item follow from the total production
+# Costumers pick a product as in demandSide.buyProductsBatch, then one company offer of that product:
+#   - Each offer (company, product) has an attractiveness weight, normalized over the companies offering the product
+#     (by default a logit on price: exp(-priceSensitivity * price / mean offered price of the product))
+#   - A costumer picks a product with its probability among the products with an affordable and in stock offer (as in
+#     the single company engine), then an offer of that product with the offer weights renormalized over those offers
+#     So with one company, or with equal offers, this is the single company engine, whatever the stock split between companies
+# Offers are sorted by price within each product, so the affordable offers of a product are a prefix found by searchsorted
+# and each round only costs array operations over costumers and products, independent of the number of companies
+import numpy as np
+import planSolver as ps
+import demandSide as dem
+
+# Attractiveness weights (nCompanies, nProducts) of the offers, zero for companies without stock of a product
+def offerAttractiveness(prices, stock, priceSensitivity=1.0):
+    prices = np.asarray(prices, dtype=float)
+    offered = np.asarray(stock)>0
+    nOffers = offered.sum(axis=0)
+    meanPrices = np.where(offered, prices, 0).sum(axis=0)/np.maximum(nOffers,1)
+    relPrices = prices/np.where(meanPrices>0, meanPrices, 1.0)
+    return np.where(offered, np.exp(-priceSensitivity*(relPrices-1)), 0.0)
+
+# Vectorized purchasing engine for several companies selling the same products
+# budgets: (nCostumers,), probs: (nCostumers, nProducts), prices, stock and attractiveness: (nCompanies, nProducts)
+# Stock conflicts of an offer are resolved in population order by demandSide.grantInOrder, denied costumers
+# try the other offers of their product in the same round
+# Returns sales (nCompanies, nProducts), bought counts per costumer and product (nCostumers, nProducts) and remaining budgets
+def buyFromCompanies(budgets, probs, prices, stock, attractiveness, rng=None, progress=None):
+    rng = dem.demRng if rng is None else rng
+    remBudgets = np.array(budgets, dtype=float)
+    probs = np.asarray(probs)
+    nCompanies, nProducts = np.shape(prices)
+    # Offers of each product sorted by price: rows are products, columns are offers
+    order = np.argsort(np.asarray(prices, dtype=float).T, axis=1, kind="stable")
+    sortedPrices = np.take_along_axis(np.asarray(prices, dtype=float).T, order, axis=1)
+    weights = np.take_along_axis(np.asarray(attractiveness, dtype=float).T, order, axis=1)
+    weights /= np.maximum(weights.sum(axis=1, keepdims=True), np.finfo(float).tiny)
+    offerStock = np.take_along_axis(np.array(stock, dtype=np.int64).T, order, axis=1).ravel()
+    offerPrices = sortedPrices.ravel()
+    offerSales = np.zeros(nProducts*nCompanies, dtype=np.int64)
+    bought = np.zeros(probs.shape, dtype=np.int32)
+    productRows = np.arange(nProducts)
+    active = np.flatnonzero(probs.sum(axis=1)>0)
+    while active.size>0:
+        if progress is not None:
+            progress(1-active.size/len(probs))
+        inStockWeights = weights.ravel()*(offerStock>0)
+        # Cumulative offer weights, flat over products, and per product starting from 0
+        flatCum = np.concatenate(([0.0], np.cumsum(inStockWeights)))
+        prodCum = flatCum[productRows[:,None]*nCompanies+np.arange(nCompanies+1)] - flatCum[productRows*nCompanies][:,None]
+        # Number of affordable offers of each product for each costumer
+        nAffordable = np.empty((active.size,nProducts), dtype=np.int64)
+        for p in range(nProducts):
+            nAffordable[:,p] = np.searchsorted(sortedPrices[p], remBudgets[active], side="right")
+        prodWeights = probs[active]*(prodCum[productRows,nAffordable]>0)
+        cumWeights = np.cumsum(prodWeights, axis=1)
+        totWeights = cumWeights[:,-1]
+        # Costumers who cannot afford anything anymore leave the market
+        canBuy = totWeights>0
+        if not canBuy.all():
+            active, nAffordable, cumWeights, totWeights = active[canBuy], nAffordable[canBuy], cumWeights[canBuy], totWeights[canBuy]
+            if active.size==0:
+                break
+        # Inverse transform sampling of a product, then of an offer within its affordable prefix
+        draws = rng.random((2,active.size))
+        selected = np.minimum((cumWeights<=(draws[0]*totWeights)[:,None]).sum(axis=1), nProducts-1)
+        firstOffer = selected*nCompanies
+        endOffer = firstOffer + nAffordable[np.arange(active.size),selected]
+        offerDraws = draws[1]
+        # Costumers denied by an offer that sold out in this round pick again among the remaining in stock offers of the
+        # same product, so a product is only missed when no affordable offer of it is left (as with a single company's stock)
+        pending = np.arange(active.size)
+        while pending.size>0:
+            first, end = firstOffer[pending], endOffer[pending]
+            offerDraws = flatCum[first] + offerDraws*(flatCum[end]-flatCum[first])
+            offers = np.clip(np.searchsorted(flatCum, offerDraws, side="right")-1, first, end-1)
+            granted, offerCounts = dem.grantInOrder(offers, offerStock)
+            if granted is None:
+                granted = np.ones(pending.size, dtype=bool)
+            buyers, buyOffers = active[pending[granted]], offers[granted]
+            bought[buyers,buyOffers//nCompanies] += 1
+            remBudgets[buyers] -= offerPrices[buyOffers]
+            offerStock -= offerCounts
+            offerSales += offerCounts
+            if granted.all():
+                break
+            flatCum = np.concatenate(([0.0], np.cumsum(weights.ravel()*(offerStock>0))))
+            pending = pending[~granted]
+            pending = pending[flatCum[endOffer[pending]]>flatCum[firstOffer[pending]]]
+            offerDraws = rng.random(pending.size)
+    # Back from price sorted offers to (company, product)
+    sales = np.zeros((nProducts,nCompanies), dtype=np.int64)
+    np.put_along_axis(sales, order, offerSales.reshape(nProducts,nCompanies), axis=1)
+    return sales.T, bought, remBudgets
+
+# Rival companies in the supply and demand markets of a market.Market (its materials, products, costumers and random stream)
+# Product and material objects of the market show the totals of all companies
+class CompetitiveMarket:
+
+    def __init__(self, market, companyNamesIn, capital=None, priceSensitivity=1.0):
+        self.market = market
+        self.companyNames = list(companyNamesIn)
+        self.capitals = np.full(len(self.companyNames), market.totalCapital if capital is None else capital, dtype=float)
+        self.priceSensitivity = priceSensitivity
+        self.bom = market.solver.bom
+        self.resetPlans()
+
+    # Reset investments, profit percentages, production, prices and sales of all companies
+    def resetPlans(self):
+        shape = (len(self.companyNames), len(self.market.prodList))
+        self.investments = np.zeros(shape)
+        self.profitPercentages = np.zeros(shape)
+        self.produced = np.zeros(shape)
+        self.prices = np.zeros(shape)
+        self.sales = np.zeros(shape, dtype=np.int64)
+        self.costsPerItem = np.zeros(shape[1])
+        self.solution = None
+
+    # Set investments and profit percentages of all companies (nCompanies, nProducts) and solve the production
+    # Every company pays the same material cost per item, so the total production solves the summed investments
+    # and each company produces its investment over that cost
+    def setPlans(self, investmentsIn, profitPercentagesIn):
+        self.investments = np.asarray(investmentsIn, dtype=float)
+        self.profitPercentages = np.asarray(profitPercentagesIn, dtype=float)
+        warmStart = None if self.solution is None else self.solution.produced
+        self.solution = ps.solveProduction(self.bom, self.investments.sum(axis=0), warmStart)
+        self.costsPerItem = self.solution.costsPerItem
+        produces = (self.solution.produced>0) & (self.costsPerItem>0)
+        self.produced = np.where(produces, self.investments/np.where(produces, self.costsPerItem, 1.0), 0.0)
+        self.prices = self.costsPerItem*(1+self.profitPercentages/100.0)
+        self.bom.applyProduction(self.solution.produced)
+        self.sales = np.zeros(self.produced.shape, dtype=np.int64)
+        return self.solution
+
+    # One sell round of the market population for the offers of all companies, returns sales (nCompanies, nProducts)
+    def sell(self, rng=None, progress=None):
+        population = self.market.population
+        population.softReset()
+        for p in self.market.prodList:
+            p.setSales(0)
+        stock = np.floor(self.produced).astype(np.int64)
+        attractiveness = offerAttractiveness(self.prices, stock, self.priceSensitivity)
+        self.sales, bought, remBudgets = buyFromCompanies(population.remBudgets, population.probs, self.prices, stock, attractiveness,
+                                                          self.market.rng if rng is None else rng, progress)
+        population.addPurchases(bought, remBudgets)
+        return self.sales
+
+    # Profit of each company and product: income of sold items minus material costs of everything produced
+    def getProfits(self):
+        return self.sales*self.prices - self.produced*self.costsPerItem
+
+    def getCompanyProfits(self):
+        return self.getProfits().sum(axis=1)
+
+    def getRemainingCapitals(self):
+        return self.capitals - self.investments.sum(axis=1)
+
+    # Market share of each company in the sales of each product
+    def getSalesShares(self):
+        totSales = self.sales.sum(axis=0)
+        return self.sales/np.where(totSales>0, totSales, 1)
+
+    # Print company results
+    def printInfo(self):
+        print("Market with {0} companies selling {1} products".format(len(self.companyNames), len(self.market.prodList)))
+        for name, invested, sold, profit in zip(self.companyNames, self.investments.sum(axis=1), self.sales.sum(axis=1), self.getCompanyProfits()):
+            print("Company: {0}, invested: {1:.1f}, sold: {2}, profit: {3:.2f}".format(name, invested, sold, profit))
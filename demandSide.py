@@ -1,13 +1,17 @@
 # This file handles the demands from the costumers
 import numpy as np
-import matplotlib.pyplot as plt
 import copy
 import products as prod
+import profiling as prof
+import registry as reg
 
 demSeed = 321867528840384100622142137672332423491
 demRng = np.random.default_rng(demSeed)
 
+# Probabilities, product objects and bought counts are lists ordered by the product registry
+# (productNamesIn can be a list of names or a registry.NameRegistry shared by all costumers)
 class Costumer:
+    __slots__ = ("name", "prodRegistry", "prodProbs", "prodObjects", "boughtCounts", "totalBudget", "remBudget")
     
     nCostumers = 0
     combinedBudget = 0
@@ -25,7 +29,7 @@ class Costumer:
     # reset remaining budget and bought product dictionary but keep everything else
     def softReset(self):
         self.remBudget = copy.copy(self.totalBudget)
-        self.boughtProdDict = dict.fromkeys(list(self.prodProbDict.keys()),0)
+        self.boughtCounts = [0]*len(self.prodRegistry)
     
     # For resetting global class vars if needed
     def resetClassVars():
@@ -33,31 +37,45 @@ class Costumer:
         Costumer.combinedBudget = 0
         Costumer.combinedRemBudget = 0
         
-    # Prepare dictionary keys based on products on sale
+    # Prepare probability, object and bought lists based on products on sale
     def productKeys(self, productNamesIn):
-        self.prodProbDict = dict.fromkeys(productNamesIn,0)
-        self.prodObjectDict = dict.fromkeys(productNamesIn,[])
-        self.boughtProdDict = dict.fromkeys(productNamesIn,0)
+        self.prodRegistry = reg.asRegistry(productNamesIn)
+        self.prodProbs = [0]*len(self.prodRegistry)
+        self.prodObjects = [None]*len(self.prodRegistry)
+        self.boughtCounts = [0]*len(self.prodRegistry)
         
-    # Prepare dictionary for relative product probabilities
+    # Set relative product probabilities, in product registry order
     def setProductProbabilities(self, productProbs):
-        self.prodProbDict = {k:v for (k,v) in zip(self.prodProbDict.keys(),productProbs)}
+        self.prodProbs = list(productProbs)[:len(self.prodRegistry)]
         
     # Get probabilities
     def getProductProbabilities(self):
-        return list(self.prodProbDict.values())
+        return list(self.prodProbs)
     
-    # Set product objects (which should be created earlier)
+    # Set product objects (which should be created earlier), in product registry order
     def setProductObjects(self, prodObjects):
-        self.prodObjectDict = {k:v for (k,v) in zip(self.prodObjectDict.keys(),prodObjects)}
+        self.prodObjects = list(prodObjects)[:len(self.prodRegistry)]
+    
+    # Name based views of the probabilities, product objects and bought counts
+    @property
+    def prodProbDict(self):
+        return dict(zip(self.prodRegistry.names,self.prodProbs))
+    
+    @property
+    def prodObjectDict(self):
+        return dict(zip(self.prodRegistry.names,self.prodObjects))
+    
+    @property
+    def boughtProdDict(self):
+        return dict(zip(self.prodRegistry.names,self.boughtCounts))
     
     # Randomly determine product probabilities for a costumer
     def setRandomProductProbabilities(self):
-        nProbs = len(self.prodProbDict)
+        nProbs = len(self.prodProbs)
         # Need nProbs random variables within [0,1) with the constraint their sum is 1
         # nProbs randoms - 1 constraint means generating nProbs-1 random variables and using their sorted difference. Below is example for nProb=5
         # For uncorrelated but sorted random variables 1,r1,r2,r3,r4,0 where r1>r2>r3>r4, 1-r1,r1-r2,r2-r3,r3-r4,r4-0 will be 5 random variables adding up to 1
-        randProbs = -1*np.diff( np.concatenate((np.concatenate((1,sorted(np.random.random(nProbs-1), reverse=True)),axis=None),0), axis=None) )
+        randProbs = -1*np.diff( np.concatenate((np.concatenate((1,sorted(demRng.random(nProbs-1), reverse=True)),axis=None),0), axis=None) )
         self.setProductProbabilities(randProbs)
     
     # Set total costumer budget, and equate remaining budget to the total budget
@@ -66,8 +84,9 @@ class Costumer:
         self.remBudget = copy.copy(self.totalBudget)
         
     # This is a class function, that sets the costumer mean total budget for the created instances
-    def setRandomBudgetMean(meanIn,sigmaIn):
-        Costumer.randomBudgetMean = float(demRng.normal(meanIn,sigmaIn,1))
+    def setRandomBudgetMean(meanIn,sigmaIn,rng=None):
+        rng = demRng if rng is None else rng
+        Costumer.randomBudgetMean = float(rng.normal(meanIn,sigmaIn))
         return Costumer.randomBudgetMean
         
     # Set budget randomly from global costumer budget distribution, and equate remaining budget to the total budget
@@ -81,12 +100,12 @@ class Costumer:
     # Costumers will keep buying products based on the assigned probabilities, as long as they can afford it
     def buyProducts(self):
         # Put prices and probs into numpy arrays
-        prices = np.array([self.prodObjectDict[k].getSellPrice() for k in self.prodObjectDict])
-        probs = np.array([self.prodProbDict[k] for k in self.prodProbDict])
+        prices = np.array([p.getSellPrice() for p in self.prodObjects])
+        probs = np.array(self.prodProbs)
         
         while True:
             # Get number of remaining products
-            prodCounts = np.array([self.prodObjectDict[k].getRemaining() for k in self.prodObjectDict])
+            prodCounts = np.array([p.getRemaining() for p in self.prodObjects])
             # Set products outside the costumer budget (or out of stock) to 0 probability
             probsWithinBudget = np.array([probs[i] if ( (self.remBudget-prices[i])>=0 and prodCounts[i]>0 ) else 0 for i in range(len(probs))])
             # Set up break condition: if all probabilities are 0, then cannot buy items anymore
@@ -95,12 +114,12 @@ class Costumer:
             # Renormalize the probabilities (now there is no issue to divide by 0)
             probsWithinBudget = probsWithinBudget/sum(probsWithinBudget)
             # Buy a product based on the probabilities and update remaining costumer budget, total product sale count, and products of this type bought by this costumer
-            selProductIndex = demRng.choice(list(self.prodObjectDict.keys()),p=probsWithinBudget)
-            self.remBudget -= self.prodObjectDict[selProductIndex].getSellPrice()
-            self.prodObjectDict[selProductIndex].sales += 1
-            self.boughtProdDict[selProductIndex] += 1
+            selProductIndex = demRng.choice(len(self.prodObjects),p=probsWithinBudget)
+            self.remBudget -= prices[selProductIndex]
+            self.prodObjects[selProductIndex].sales += 1
+            self.boughtCounts[selProductIndex] += 1
             #print("In buyProducts function: Bought {0} with cost {1}, remaining budget is {2} of total budget {3}" \
-            #    .format(selProductIndex,self.prodObjectDict[selProductIndex].getSellPrice(), self.remBudget, self.totalBudget))
+            #    .format(self.prodRegistry.nameOf(selProductIndex),prices[selProductIndex], self.remBudget, self.totalBudget))
     
     # Add total budget and remaining budget to the combined costumer budgets
     def setCombinedBudgets(self):
@@ -111,33 +130,436 @@ class Costumer:
     def printInfo(self):
         print("Costumer name is: {0}".format(self.name))
         print("Total costumer budget was: {0:.2f}".format(self.totalBudget))
-        for k in self.prodProbDict:
-            print("Price of product: {0} is {1:.2f}".format(k,self.prodObjectDict[k].getSellPrice()))
-            print("Probability of buying product (as budget permits): {0} is {1:.2f}".format(k,self.prodProbDict[k]))
-            print("Number of bought products of type: {0} is {1}".format(k,self.boughtProdDict[k]))
+        prodObjectDict, boughtProdDict = self.prodObjectDict, self.boughtProdDict
+        for k, prob in self.prodProbDict.items():
+            print("Price of product: {0} is {1:.2f}".format(k,prodObjectDict[k].getSellPrice()))
+            print("Probability of buying product (as budget permits): {0} is {1:.2f}".format(k,prob))
+            print("Number of bought products of type: {0} is {1}".format(k,boughtProdDict[k]))
         print("Remaining budget after purchases:{0:.2f}".format(self.remBudget))
 
 
+# Struct of arrays representation of many costumers, rows of each array correspond to costumers
+# Budgets and probabilities are float32 and bought counts int32 to keep large populations compact
+class CustomerPopulation:
+    
+    def __init__(self, nCostumersIn, productNamesIn):
+        self.nCostumers = nCostumersIn
+        self.productNames = list(productNamesIn)
+        self.prodObjects = []
+        self.totalBudgets = np.zeros(nCostumersIn, dtype=np.float32)
+        self.remBudgets = np.zeros(nCostumersIn, dtype=np.float32)
+        self.probs = np.zeros((nCostumersIn,len(self.productNames)), dtype=np.float32)
+        self.bought = np.zeros((nCostumersIn,len(self.productNames)), dtype=np.int32)
+        # Budget histogram and budget per product, kept up to date by the budget and probability setters
+        self.budgetStats = BudgetStats(len(self.productNames), round(nCostumersIn/10) if nCostumersIn>10 else 1)
+        self.updateBudgetStats()
+        
+    def __len__(self):
+        return self.nCostumers
+    
+    # Build a population from a list of Costumer objects
+    def fromCostumers(costumerList):
+        population = CustomerPopulation(len(costumerList), costumerList[0].prodRegistry.names)
+        population.setProductObjects(costumerList[0].prodObjects)
+        population.setTotalBudgets([c.totalBudget for c in costumerList])
+        population.remBudgets[:] = [c.remBudget for c in costumerList]
+        population.setProductProbabilities([c.getProductProbabilities() for c in costumerList])
+        population.bought[:] = [c.boughtCounts for c in costumerList]
+        return population
+        
+    # Build a population around existing arrays (for example memory mapped ones) without copying them
+    # Budget statistics are recomputed unless budgetStats is given
+    def fromArrays(productNames, totalBudgets, probs, remBudgets=None, bought=None, budgetStats=None):
+        population = CustomerPopulation(0, productNames)
+        population.nCostumers = len(totalBudgets)
+        population.totalBudgets = totalBudgets
+        population.probs = probs
+        population.remBudgets = totalBudgets.copy() if remBudgets is None else remBudgets
+        population.bought = np.zeros(probs.shape, dtype=np.int32) if bought is None else bought
+        if budgetStats is None:
+            population.budgetStats = BudgetStats(len(productNames), round(len(totalBudgets)/10) if len(totalBudgets)>10 else 1)
+            population.updateBudgetStats()
+        else:
+            population.budgetStats = budgetStats
+        return population
+        
+    # reset remaining budgets and bought products but keep everything else
+    def softReset(self):
+        self.remBudgets[:] = self.totalBudgets
+        self.bought[:] = 0
+    
+    # Set product objects (which should be created earlier)
+    def setProductObjects(self, prodObjects):
+        self.prodObjects = list(prodObjects)
+        
+    # Set relative product probabilities, one row per costumer
+    def setProductProbabilities(self, productProbs):
+        self.probs[:] = productProbs
+        self.updateBudgetStats()
+        
+    # Set total budgets and equate remaining budgets to the total budgets
+    def setTotalBudgets(self, totalBudgetsIn):
+        self.totalBudgets[:] = totalBudgetsIn
+        self.remBudgets[:] = self.totalBudgets
+        self.updateBudgetStats()
+        
+    # Recompute the budget statistics, call after changing totalBudgets or probs directly
+    def updateBudgetStats(self, chunkSize=1000000):
+        self.budgetStats.update(self.totalBudgets, self.probs, chunkSize)
+    
+    # Set all budgets from the pareto costumer budget distribution (see Costumer.setRandomTotalBudget and generateBudgets)
+    # The budget mean defaults to the class wide Costumer.randomBudgetMean
+    def setRandomTotalBudgets(self, rng=None, chunkSize=None, budgetMean=None):
+        budgetMean = Costumer.randomBudgetMean if budgetMean is None else budgetMean
+        generateBudgets(self.nCostumers, budgetMean, rng, chunkSize, out=self.totalBudgets)
+        self.remBudgets[:] = self.totalBudgets
+        self.updateBudgetStats()
+        return self.totalBudgets
+    
+    # Set all product probabilities uniformly on the simplex as in Costumer.setRandomProductProbabilities (see generateProductProbabilities)
+    def setRandomProductProbabilities(self, rng=None, chunkSize=None):
+        generateProductProbabilities(self.nCostumers, len(self.productNames), rng, chunkSize, out=self.probs)
+        self.updateBudgetStats()
+        return self.probs
+        
+    # Costumers buy products with the vectorized engine, product sales are updated with the bought items
+    # progress and transactionLog are passed to buyProductsBatch, nothing is updated if progress cancels the round
+    # With blockSampling, buyProductsBlocks draws the purchases in multinomial blocks (same distribution, faster for large budgets)
+    def buyProducts(self, rng=None, progress=None, transactionLog=None, blockSampling=False):
+        prices = np.array([p.getSellPrice() for p in self.prodObjects])
+        stock = np.array([p.getRemaining() for p in self.prodObjects])
+        engine = buyProductsBlocks if blockSampling else buyProductsBatch
+        bought, remBudgets = engine(self.remBudgets, self.probs, prices, stock, rng, progress, transactionLog)
+        return self.addPurchases(bought, remBudgets)
+
+    # Add purchases made outside buyProducts (for example by shardedSell.sellSharded) and update product sales
+    def addPurchases(self, bought, remBudgets):
+        self.remBudgets[:] = remBudgets
+        self.bought += bought
+        for j, p in enumerate(self.prodObjects):
+            p.sales += int(bought[:,j].sum())
+        return bought
+    
+    # Get a per costumer view, index starts from 0 while names start from C1
+    def getCostumer(self, index):
+        return CostumerView(self, index)
+    
+    # Print important quantities of a costumer
+    def printInfo(self, index):
+        self.getCostumer(index).printInfo()
+        
+
+# Pre-binned costumer budget statistics: histogram of total budgets and total budget per product (sum of budget*probability)
+# Built in chunks when budgets or probabilities change, so plots read nBins (or nProducts) values instead of all costumers
+# Bins are nBins (at most maxBins) equal widths from 0 to the largest budget
+class BudgetStats:
+    
+    def __init__(self, nProducts, nBins, maxBins=1000):
+        self.nProducts = nProducts
+        self.nBins = max(min(nBins, maxBins), 1)
+        self.update(np.zeros(0), np.zeros((0,nProducts)))
+        
+    # Recompute from budgets and probabilities, chunkSize costumers at a time to limit temporary memory
+    def update(self, totalBudgets, probs, chunkSize=1000000):
+        self.nCostumers = len(totalBudgets)
+        maxBudget = float(totalBudgets.max()) if self.nCostumers>0 else 0.0
+        self.edges = np.linspace(0, maxBudget if maxBudget>0 else 1.0, self.nBins+1)
+        self.counts = np.zeros(self.nBins, dtype=np.int64)
+        self.productBudgets = np.zeros(self.nProducts)
+        for start in range(0, self.nCostumers, chunkSize):
+            budgetChunk = totalBudgets[start:start+chunkSize].astype(float)
+            self.counts += np.histogram(budgetChunk, self.edges)[0]
+            self.productBudgets += budgetChunk @ probs[start:start+chunkSize]
+        self.totalBudget = float(self.productBudgets.sum())
+        
+    # Statistics of a list of Costumer objects
+    def fromCostumers(costumerList):
+        stats = BudgetStats(len(costumerList[0].prodProbs), round(len(costumerList)/10) if len(costumerList)>10 else 1)
+        stats.update(np.array([c.totalBudget for c in costumerList]), np.array([c.getProductProbabilities() for c in costumerList]))
+        return stats
+        
+
+# Read only view of a single costumer in a CustomerPopulation, with the same fields as Costumer
+class CostumerView:
+    
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+        self.name = "C{0}".format(index+1)
+        
+    @property
+    def totalBudget(self):
+        return float(self.population.totalBudgets[self.index])
+    
+    @property
+    def remBudget(self):
+        return float(self.population.remBudgets[self.index])
+    
+    @property
+    def prodProbDict(self):
+        return dict(zip(self.population.productNames,self.population.probs[self.index].tolist()))
+    
+    @property
+    def prodObjectDict(self):
+        return dict(zip(self.population.productNames,self.population.prodObjects))
+    
+    @property
+    def boughtProdDict(self):
+        return dict(zip(self.population.productNames,self.population.bought[self.index].tolist()))
+    
+    def getProductProbabilities(self):
+        return list(self.prodProbDict.values())
+    
+    # Print important quantities (same format as Costumer.printInfo)
+    def printInfo(self):
+        Costumer.printInfo(self)
+
+
+# Pareto (shape 2) budgets for nCostumers, scaled by budgetMean as in Costumer.setRandomTotalBudget
+# Drawn as expm1(E/2) with standard exponential E, so float32 outputs are filled in place without float64 temporaries
+# With chunkSize, costumers are generated chunkSize at a time, giving the same values as a single call for the same rng state
+@prof.timed("generateCostumers")
+def generateBudgets(nCostumers, budgetMean, rng=None, chunkSize=None, out=None):
+    prof.count("rngDraws", nCostumers)
+    rng = demRng if rng is None else rng
+    out = np.empty(nCostumers, dtype=np.float32) if out is None else out
+    chunkSize = nCostumers if chunkSize is None else chunkSize
+    for start in range(0, nCostumers, max(chunkSize,1)):
+        chunk = out[start:start+chunkSize]
+        rng.standard_exponential(out=chunk, dtype=chunk.dtype)
+        chunk *= 0.5
+        np.expm1(chunk, out=chunk)
+        chunk *= budgetMean
+    return out
+
+# Product probabilities uniform on the simplex (Dirichlet with unit parameters) for nCostumers
+# Normalized standard exponentials are used, which is equivalent to the sorted uniform differences in Costumer.setRandomProductProbabilities
+# With chunkSize, costumers are generated chunkSize at a time, giving the same values as a single call for the same rng state
+@prof.timed("generateCostumers")
+def generateProductProbabilities(nCostumers, nProducts, rng=None, chunkSize=None, out=None):
+    prof.count("rngDraws", nCostumers*nProducts)
+    rng = demRng if rng is None else rng
+    out = np.empty((nCostumers,nProducts), dtype=np.float32) if out is None else out
+    chunkSize = nCostumers if chunkSize is None else chunkSize
+    for start in range(0, nCostumers, max(chunkSize,1)):
+        chunk = out[start:start+chunkSize]
+        rng.standard_exponential(out=chunk, dtype=chunk.dtype)
+        chunk /= chunk.sum(axis=1, keepdims=True)
+    return out
+
+# Raised by progress callbacks to stop a sell round that is no longer needed
+class PurchaseCancelled(Exception):
+    pass
+
+# Vectorized purchasing engine, resolves purchases of a whole costumer population in rounds
+# budgets: (nCostumers,) remaining budgets, probs: (nCostumers, nProducts) relative product probabilities
+# prices: (nProducts,) sell prices, stock: (nProducts,) remaining product counts (shared by all costumers)
+# In every round each active costumer picks one affordable and in stock product with renormalized probabilities (same rule as buyProducts)
+# If a product is oversubscribed in a round, costumers earlier in the population order get the remaining items first, others pick again next round
+# If given, progress is called every round with the fraction of costumers done buying, it may raise PurchaseCancelled to stop
+# If given, transactionLog.record gets the buyers, products, prices and remaining budgets of every round (see transactionLog.py)
+# Returns the bought counts (nCostumers, nProducts) and the remaining budgets
+@prof.timed("purchase")
+def buyProductsBatch(budgets, probs, prices, stock, rng=None, progress=None, transactionLog=None):
+    rng = demRng if rng is None else rng
+    remBudgets = np.array(budgets, dtype=float)
+    probs = np.asarray(probs)
+    prices = np.asarray(prices, dtype=float)
+    stock = np.array(stock, dtype=np.int64)
+    bought = np.zeros(probs.shape, dtype=np.int32)
+    # Costumers that can still buy something, kept in population order
+    active = np.flatnonzero(probs.sum(axis=1)>0)
+    while active.size>0:
+        if progress is not None:
+            progress(1-active.size/len(probs))
+        active = buyOneItemRound(active, remBudgets, probs, prices, stock, bought, rng, transactionLog)
+    return bought, remBudgets
+
+# Grant the items selected by costumers (offers: flat stock indices, in population order) from stock
+# If an offer is oversubscribed, costumers earlier in the population order get the remaining items first
+# Returns the granted mask (None when everyone is granted) and the granted counts per offer
+def grantInOrder(offers, stock):
+    counts = np.bincount(offers, minlength=stock.size)
+    if (counts<=stock).all():
+        return None, counts
+    # Rank costumers within each selected offer to resolve its stock in population order
+    order = np.argsort(offers, kind="stable")
+    offersSorted = offers[order]
+    ranks = np.empty(offers.size, dtype=np.int64)
+    ranks[order] = np.arange(offers.size) - np.searchsorted(offersSorted, offersSorted, side="left")
+    granted = ranks < stock[offers]
+    return granted, np.bincount(offers[granted], minlength=stock.size)
+
+# One round of buyProductsBatch: each active costumer buys one item, remBudgets, stock and bought are updated in place
+# Several plans (rows of prices and stock, (nPlans, nProducts)) can sell to copies of the same costumers at once, then
+# active holds plan*nCostumers+costumer pairs and remBudgets one budget per pair (see planOptimizer.sellPlansBatch)
+# bought can be None when the counts per costumer are not needed
+# With commonDraws, a costumer uses the same random number for every plan in the round (common random numbers)
+# Returns the costumers that could afford something at the start of the round (they are still active)
+def buyOneItemRound(active, remBudgets, probs, prices, stock, bought, rng, transactionLog=None, commonDraws=False):
+    nCostumers, nProducts = np.shape(probs)
+    if np.ndim(prices)==1:
+        costumers, plans = active, None
+        planPrices, inStock = prices, stock>0
+    else:
+        plans, costumers = np.divmod(active, nCostumers)
+        planPrices, inStock = prices[plans], stock[plans]>0
+    # Zero the probabilities of products outside the budget or out of stock
+    weights = probs[costumers] * ((remBudgets[active,None]-planPrices)>=0) * inStock
+    cumWeights = np.cumsum(weights, axis=1)
+    totWeights = cumWeights[:,-1]
+    # Costumers who cannot afford anything anymore leave the market
+    canBuy = totWeights>0
+    if not canBuy.all():
+        active, costumers, cumWeights, totWeights = active[canBuy], costumers[canBuy], cumWeights[canBuy], totWeights[canBuy]
+        plans = None if plans is None else plans[canBuy]
+        if active.size==0:
+            return active
+    # Inverse transform sampling of one product per costumer
+    prof.count("purchaseRounds")
+    prof.count("rngDraws", nCostumers if commonDraws else active.size)
+    draws = (rng.random(nCostumers)[costumers] if commonDraws else rng.random(active.size))*totWeights
+    selected = np.minimum((cumWeights<=draws[:,None]).sum(axis=1), nProducts-1)
+    # Offers are flat (plan, product) stock indices
+    offers = selected if plans is None else plans*nProducts+selected
+    flatStock = stock if plans is None else stock.reshape(-1)
+    granted, counts = grantInOrder(offers, flatStock)
+    if granted is None:
+        buyers, buyIdx, buyOffers = active, selected, offers
+    else:
+        buyers, buyIdx, buyOffers = active[granted], selected[granted], offers[granted]
+    # Update remaining budgets, bought counts and remaining stock
+    buyPrices = prices[buyIdx] if plans is None else prices.reshape(-1)[buyOffers]
+    if bought is not None:
+        bought[buyers,buyIdx] += 1
+    remBudgets[buyers] -= buyPrices
+    flatStock -= counts
+    prof.count("purchases", buyers.size)
+    if transactionLog is not None:
+        transactionLog.record(buyers, buyIdx, buyPrices, remBudgets[buyers])
+    return active
+
+# Block sampling version of buyProductsBatch with the same arguments, returns are distributed as in buyProductsBatch
+# While a costumer's budget covers the most expensive product it can afford (price maxPrice), its next floor(budget/maxPrice)
+# picks all have the same choice set and probabilities, so their counts are drawn at once from a multinomial distribution
+# Stock is shared, so blocks are only drawn for a number of rounds in which no product can run out (stock // active costumers);
+# when that is zero, single item rounds resolve the remaining stock in population order as in buyProductsBatch
+# Run time grows with the number of products and blocks instead of the number of items bought
+# If a transactionLog is given, the items of a block are logged in a random order, drawn from a stream spawned from rng
+@prof.timed("purchase")
+def buyProductsBlocks(budgets, probs, prices, stock, rng=None, progress=None, transactionLog=None):
+    rng = demRng if rng is None else rng
+    logRng = rng.spawn(1)[0] if transactionLog is not None else None
+    remBudgets = np.array(budgets, dtype=float)
+    probs = np.asarray(probs)
+    prices = np.asarray(prices, dtype=float)
+    stock = np.array(stock, dtype=np.int64)
+    bought = np.zeros(probs.shape, dtype=np.int32)
+    active = np.flatnonzero(probs.sum(axis=1)>0)
+    while active.size>0:
+        if progress is not None:
+            progress(1-active.size/len(probs))
+        inStock = stock>0
+        safeRounds = (stock[inStock]//active.size).min() if inStock.any() else 0
+        if safeRounds==0:
+            active = buyOneItemRound(active, remBudgets, probs, prices, stock, bought, rng, transactionLog)
+            continue
+        # Every costumer buys up to safeRounds items in blocks, costumers who cannot afford anything leave the market
+        roundsLeft = np.full(active.size, safeRounds, dtype=np.int64)
+        buyers = active
+        while buyers.size>0:
+            weights = probs[buyers].astype(float) * ((remBudgets[buyers,None]-prices)>=0) * inStock
+            totWeights = weights.sum(axis=1)
+            canBuy = totWeights>0
+            if not canBuy.all():
+                active = np.setdiff1d(active, buyers[~canBuy], assume_unique=True)
+                buyers, weights, totWeights, roundsLeft = buyers[canBuy], weights[canBuy], totWeights[canBuy], roundsLeft[canBuy]
+                if buyers.size==0:
+                    break
+            maxPrices = np.where(weights>0, prices, 0).max(axis=1)
+            blockSizes = np.floor(remBudgets[buyers]/maxPrices).astype(np.int64)
+            blockSizes -= blockSizes*maxPrices > remBudgets[buyers]
+            blockSizes = np.minimum(blockSizes, roundsLeft)
+            prof.count("purchaseRounds")
+            prof.count("rngDraws", weights.size)
+            counts = rng.multinomial(blockSizes, weights/totWeights[:,None])
+            if transactionLog is not None:
+                logBlocks(transactionLog, buyers, counts, prices, remBudgets[buyers], logRng)
+            bought[buyers] += counts.astype(np.int32)
+            remBudgets[buyers] -= counts @ prices
+            stock -= counts.sum(axis=0)
+            prof.count("purchases", int(blockSizes.sum()))
+            roundsLeft -= blockSizes
+            keep = roundsLeft>0
+            buyers, roundsLeft = buyers[keep], roundsLeft[keep]
+    return bought, remBudgets
+
+# Log the items of one block per buyer, in a uniformly random order within each buyer, with the budget left after each item
+def logBlocks(transactionLog, buyers, counts, prices, startBudgets, rng):
+    rows, products = np.nonzero(counts)
+    nItems = counts[rows,products]
+    rows, products = np.repeat(rows, nItems), np.repeat(products, nItems)
+    order = np.lexsort((rng.random(rows.size), rows))
+    rows, products = rows[order], products[order]
+    spent = np.cumsum(prices[products])
+    # Subtract what the buyer spent before this block started
+    groupStarts = np.searchsorted(rows, rows, side="left")
+    spent -= np.concatenate(([0.0], spent))[groupStarts]
+    transactionLog.record(buyers[rows], products, prices[products], startBudgets[rows]-spent)
+
+# Let a list of costumers buy products with the vectorized engine, then write results back to costumer and product objects
+# Costumers are expected to share the same product objects (as set by setProductObjects)
+def buyProductsForCostumers(costumerList, rng=None):
+    prodObjects = costumerList[0].prodObjects
+    budgets = np.array([c.remBudget for c in costumerList])
+    probs = np.array([c.getProductProbabilities() for c in costumerList])
+    prices = np.array([p.getSellPrice() for p in prodObjects])
+    stock = np.array([p.getRemaining() for p in prodObjects])
+    bought, remBudgets = buyProductsBatch(budgets, probs, prices, stock, rng)
+    for i, c in enumerate(costumerList):
+        c.remBudget = remBudgets[i]
+        for j in range(len(c.boughtCounts)):
+            c.boughtCounts[j] += int(bought[i,j])
+    for j, p in enumerate(prodObjects):
+        p.sales += int(bought[:,j].sum())
+    return bought
+
+# Budget statistics of either a CustomerPopulation (precomputed) or a list of Costumer objects
+def getBudgetStats(costumers):
+    if isinstance(costumers, CustomerPopulation):
+        return costumers.budgetStats
+    return BudgetStats.fromCostumers(costumers)
+
 # Function to plot budget distribution of the costumers
 def plotBudgetDist(costumerList):
-        totalBudgets = np.array([c.totalBudget for c in costumerList])
-        nBins = round(len(totalBudgets)/10) if len(totalBudgets)>10 else 1
-        fig, ax = plt.subplots()
-        ax.hist(totalBudgets,nBins)
-        ax.set_title("Costumer Budget Distribution")
-        ax.set_xlabel("Costumer Budgets")
-        ax.set_ylabel("Counts")
-        plt.yscale('log')
-        return fig, ax
+    stats = getBudgetStats(costumerList)
+    return plotBudgetHistogram(stats.edges, stats.counts)
+
+# Plot a budget histogram from bin edges and counts (does not read any costumer)
+def plotBudgetHistogram(edges, counts):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    # Histogram from the precomputed bins: one weighted entry per bin
+    ax.hist(edges[:-1], edges, weights=counts)
+    ax.set_title("Costumer Budget Distribution")
+    ax.set_xlabel("Costumer Budgets")
+    ax.set_ylabel("Counts")
+    plt.yscale('log')
+    return fig, ax
     
 # Function to return all costumers budget distribution
 def plotBudgetPerProduct(costumerList):
-    # Get product names from first costumer
-    prodNames = list(costumerList[0].prodProbDict.keys())
-    # Estimate product budgets as sum over costumers totalBudget*probability of product
-    prodBudgets = sum([c.totalBudget*np.array(list(c.prodProbDict.values())) for c in costumerList])
-    print(prodBudgets)
-    # Plot
+    # Product budgets are sums over costumers totalBudget*probability of product
+    if isinstance(costumerList, CustomerPopulation):
+        prodNames = costumerList.productNames
+    else:
+        # Get product names from first costumer
+        prodNames = list(costumerList[0].prodProbDict.keys())
+    return plotProductBudgets(prodNames, getBudgetStats(costumerList).productBudgets)
+
+# Plot the budget of each product as a pie chart (does not read any costumer)
+def plotProductBudgets(prodNames, prodBudgets):
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots()
     combLabels = ["{0}: {1:.1f}$".format(s,i) for s,i in zip(prodNames,prodBudgets)]
     ax.pie(prodBudgets, labels=combLabels, labeldistance=1.05)
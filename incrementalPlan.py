@@ -0,0 +1,139 @@
+# This file updates a solved plan when only some investments or profit percentages change
+# Products and materials form a dependency graph through the bill of materials: a product depends on the prices of its
+# materials, and a material price on the production of every product using it. Products connected through shared
+# materials (a component) are coupled by the production solve, separate components are independent
+# So an investment change only solves the components of the changed products, and a profit percentage change only
+# reprices its product. Every update returns a PlanInvalidation telling which quantities changed
+import numpy as np
+import products as prod
+import planSolver as ps
+
+# Components of the product/material graph of a bill of materials matrix (nProducts x nMaterials)
+# Returns a list of (product indices, material indices), materials used by no product are left out
+def productComponents(matrix):
+    uses = np.asarray(matrix)!=0
+    nProducts = uses.shape[0]
+    labels = np.arange(nProducts)
+    # Propagate the smallest product label through shared materials until nothing changes
+    while True:
+        matLabels = np.where(uses, labels[:,None], nProducts).min(axis=0, initial=nProducts)
+        newLabels = np.minimum(labels, np.where(uses, matLabels[None,:], nProducts).min(axis=1, initial=nProducts))
+        if np.array_equal(newLabels, labels):
+            break
+        labels = newLabels
+    return [(np.flatnonzero(labels==l), np.flatnonzero(matLabels==l)) for l in np.unique(labels)]
+
+# Quantities changed by a plan update, as masks over products and materials
+# expectedSales is set when any price or production changed: costumers substitute between products, so expected sales
+# (and expected profits) of every product depend on all prices and stocks
+class PlanInvalidation:
+
+    def __init__(self, prodNames, matNames):
+        self.prodNames = list(prodNames)
+        self.matNames = list(matNames)
+        nProducts, nMaterials = len(self.prodNames), len(self.matNames)
+        self.investments = np.zeros(nProducts, dtype=bool)
+        self.profitPercentages = np.zeros(nProducts, dtype=bool)
+        self.produced = np.zeros(nProducts, dtype=bool)
+        self.costsPerItem = np.zeros(nProducts, dtype=bool)
+        self.sellPrices = np.zeros(nProducts, dtype=bool)
+        self.matDemands = np.zeros(nMaterials, dtype=bool)
+        self.matPrices = np.zeros(nMaterials, dtype=bool)
+        self.expectedSales = False
+        # Number of components solved again by the update
+        self.nSolved = 0
+
+    # Everything changed (a full solve)
+    @classmethod
+    def everything(cls, prodNames, matNames):
+        invalidation = cls(prodNames, matNames)
+        for mask in (invalidation.investments, invalidation.profitPercentages, invalidation.produced, invalidation.costsPerItem,
+                     invalidation.sellPrices, invalidation.matDemands, invalidation.matPrices):
+            mask[:] = True
+        invalidation.expectedSales = True
+        return invalidation
+
+    def isEmpty(self):
+        return not (self.getProductRows().size or self.matDemands.any() or self.matPrices.any() or self.expectedSales)
+
+    # Products with a changed plan table row, not counting the expected profit column
+    def getProductRows(self):
+        return np.flatnonzero(self.investments | self.profitPercentages | self.produced | self.costsPerItem | self.sellPrices)
+
+    # Names of the changed products and materials for every quantity
+    def getInvalidated(self):
+        prodMasks = {"investments":self.investments, "profitPercentages":self.profitPercentages, "produced":self.produced,
+                     "costsPerItem":self.costsPerItem, "sellPrices":self.sellPrices}
+        invalidated = {k:[self.prodNames[i] for i in np.flatnonzero(v)] for (k, v) in prodMasks.items()}
+        invalidated.update({k:[self.matNames[i] for i in np.flatnonzero(v)] for (k, v) in (("matDemands",self.matDemands),("matPrices",self.matPrices))})
+        invalidated["expectedSales"] = list(self.prodNames) if self.expectedSales else []
+        return invalidated
+
+    def printInfo(self):
+        print("Components solved: {0}".format(self.nSolved))
+        for k, v in self.getInvalidated().items():
+            print("{0}: {1}".format(k, v))
+
+# Incremental plan updates for the products and materials of a planSolver.PlanSolver
+# Components and their bills of materials are built once, and built again when the solver's bill of materials was rebuilt
+# (planSolver.PlanSolver.softReset, after material requirements or supply curves change)
+class IncrementalPlanner:
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.reset()
+
+    def reset(self):
+        self.bomVersion = self.solver.bomVersion
+        self.bom = self.solver.bom
+        self.components = productComponents(self.bom.matrix)
+        self.componentOf = np.empty(len(self.bom.prodList), dtype=np.int64)
+        for c, (prods, mats) in enumerate(self.components):
+            self.componentOf[prods] = c
+        self.componentBoms = {}
+
+    # Bill of materials of a component, writing to the same product and material objects
+    def getComponentBom(self, c):
+        if c not in self.componentBoms:
+            prods, mats = self.components[c]
+            self.componentBoms[c] = prod.BillOfMaterials([self.bom.prodList[i] for i in prods], [self.bom.matList[j] for j in mats])
+        return self.componentBoms[c]
+
+    # Update a solution (planSolver.PlanSolution of investments and profitPercentages) to the new investments and profit percentages
+    # Only the components with changed investments are solved (warm started) and written to the product and material objects,
+    # and only their products and the products with changed profit percentages are repriced
+    # The residual of the result is the largest of the solved components and the previous solution
+    # Returns the new solution and a PlanInvalidation
+    def update(self, solution, investments, profitPercentages, newInvestments, newProfitPercentages):
+        if self.bomVersion!=self.solver.bomVersion:
+            self.reset()
+        newInvestments = np.asarray(newInvestments, dtype=float)
+        newProfitPercentages = np.asarray(newProfitPercentages, dtype=float)
+        invalidation = PlanInvalidation(self.bom.productNames, self.bom.materialNames)
+        invalidation.investments = newInvestments!=investments
+        invalidation.profitPercentages = newProfitPercentages!=profitPercentages
+        produced, matDemands, matPrices = solution.produced.copy(), solution.matDemands.copy(), solution.matPrices.copy()
+        costsPerItem = solution.costsPerItem.copy()
+        converged, iterations, residual = solution.converged, 0, solution.residual
+        repriced = invalidation.profitPercentages.copy()
+        for c in np.unique(self.componentOf[invalidation.investments]):
+            prods, mats = self.components[c]
+            compBom = self.getComponentBom(c)
+            compSolution = ps.solveProduction(compBom, newInvestments[prods], produced[prods], self.solver.tol, self.solver.maxIter)
+            compBom.applyProduction(compSolution.produced)
+            produced[prods], costsPerItem[prods] = compSolution.produced, compSolution.costsPerItem
+            matDemands[mats], matPrices[mats] = compSolution.matDemands, compSolution.matPrices
+            converged = converged and compSolution.converged
+            iterations += compSolution.iterations
+            residual = max(residual, compSolution.residual)
+            repriced[prods] = True
+            invalidation.nSolved += 1
+        for i in np.flatnonzero(repriced):
+            self.bom.prodList[i].setProfitPercentage(newProfitPercentages[i])
+        invalidation.produced = produced!=solution.produced
+        invalidation.costsPerItem = costsPerItem!=solution.costsPerItem
+        invalidation.matDemands = matDemands!=solution.matDemands
+        invalidation.matPrices = matPrices!=solution.matPrices
+        invalidation.sellPrices = invalidation.costsPerItem | invalidation.profitPercentages
+        invalidation.expectedSales = bool(invalidation.produced.any() or invalidation.sellPrices.any())
+        return ps.PlanSolution(produced, matDemands, matPrices, costsPerItem, converged, iterations, residual), invalidation
@@ -0,0 +1,246 @@
+# This file provides a headless market: raw materials, products, costumers and a company plan in one object
+# Nothing is built at import time and matplotlib is not imported, so batch workers, tests and app sessions can create their own markets
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import supplySide as sup
+import products as prod
+import demandSide as dem
+import planSolver as ps
+import profiling as prof
+import shardedSell as ss
+import registry as reg
+import expectedDemand as ed
+import priceSweep as sw
+import incrementalPlan as ip
+
+class Market:
+
+    # If an existing costumer population is given, it is used as is and the market is not randomized
+    def __init__(self, matNamesIn, prodNamesIn, nCostumers, capital=100000, seed=None, budgetMean=25, budgetSigma=5, population=None):
+        self.matNames = list(matNamesIn)
+        self.prodNames = list(prodNamesIn)
+        self.totalCapital = capital
+        self.budgetMeanPars = (budgetMean, budgetSigma)
+        # Name to index mappings shared by all products and materials of the market
+        self.registry = reg.MarketRegistry(self.matNames, self.prodNames)
+        self.matList = [sup.RawMaterial(s) for s in self.matNames]
+        self.prodList = [prod.Product(s, self.registry.materials) for s in self.prodNames]
+        for p in self.prodList:
+            p.setMaterialObjects(self.matList)
+        self.population = dem.CustomerPopulation(nCostumers, self.prodNames) if population is None else population
+        self.population.setProductObjects(self.prodList)
+        self.solver = ps.PlanSolver(self.prodList, self.matList)
+        # Plan updates only solve the products connected to the changed ones (see incrementalPlan.py)
+        self.planner = ip.IncrementalPlanner(self.solver)
+        # Purchases are not logged unless a transaction log is set
+        self.transactionLog = None
+        self.sellRound = 0
+        # Purchases are drawn one item per round unless block sampling is turned on (see demandSide.buyProductsBlocks)
+        self.blockSampling = False
+        # Sell rounds run in one process unless a number of shards is set (see shardedSell.py)
+        self.nShards = None
+        self.shardWorkers = None
+        self.shardExecutor = None
+        # Expected sales are estimated on this many representative costumers (see expectedDemand.costumerSample)
+        self.expectedSampleSize = 20000
+        self.expectedSample = None
+        if population is None:
+            self.randomize(seed)
+        else:
+            self.seed = seed
+            self.rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(4)[3])
+            self.budgetMean = budgetMean
+            self.resetPlan()
+
+    # Draw new supply curves, material requirements and costumers from independent streams spawned from the seed
+    # The same seed gives the same market, the purchase stream is reset as well
+    def randomize(self, seed=None, chunkSize=1000000):
+        self.seed = seed
+        matRng, prodRng, costRng, self.rng = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(4)]
+        for m in self.matList:
+            m.setRandomSupplyPars(matRng)
+        for p in self.prodList:
+            p.setRandomMaterialReqs(prodRng)
+        self.budgetMean = float(costRng.normal(*self.budgetMeanPars))
+        self.population.setRandomTotalBudgets(costRng, chunkSize, self.budgetMean)
+        self.population.setRandomProductProbabilities(costRng, chunkSize)
+        self.expectedSample = None
+        self.solver.softReset()
+        self.softReset()
+
+    # Reset plan, production, sales and costumer budgets but keep the market parameters
+    def softReset(self):
+        for m in self.matList:
+            m.softReset()
+        for p in self.prodList:
+            p.softReset()
+        self.population.softReset()
+        self.resetPlan()
+        
+    # Reset the company plan only (investments, profit percentages and remaining capital)
+    def resetPlan(self):
+        self.investments = np.zeros(len(self.prodList))
+        self.profitPercentages = np.zeros(len(self.prodList))
+        self.remCapital = self.totalCapital
+        self.solution = None
+        self.expectedSales = None
+        self.planner.reset()
+
+    # Solve production from the investments (warm started from the previous plan) and set prices from the profit percentages
+    @prof.timed("plan")
+    def setPlan(self, investmentsIn, profitPercentagesIn):
+        self.investments = np.asarray(investmentsIn, dtype=float)
+        self.profitPercentages = np.asarray(profitPercentagesIn, dtype=float)
+        for p in self.prodList:
+            p.softReset()
+        self.solution = self.solver.solve(self.investments)
+        self.solver.applySolution(self.profitPercentages)
+        self.remCapital = self.totalCapital - self.investments.sum()
+        self.expectedSales = None
+        return self.solution
+
+    # Change the plan to new investments and profit percentages, recomputing only what depends on the changed values
+    # Gives the same plan as setPlan (up to the solver tolerance), sales of all products are reset as in setPlan
+    # Returns an incrementalPlan.PlanInvalidation with the changed quantities (everything when there was no plan yet)
+    @prof.timed("plan")
+    def updatePlan(self, investmentsIn, profitPercentagesIn):
+        if self.solution is None:
+            self.setPlan(investmentsIn, profitPercentagesIn)
+            return ip.PlanInvalidation.everything(self.prodNames, self.matNames)
+        self.solution, invalidation = self.planner.update(self.solution, self.investments, self.profitPercentages,
+                                                          investmentsIn, profitPercentagesIn)
+        self.solver.lastSolution = self.solution
+        self.investments = np.asarray(investmentsIn, dtype=float)
+        self.profitPercentages = np.asarray(profitPercentagesIn, dtype=float)
+        for p in self.prodList:
+            p.setSales(0)
+        self.remCapital = self.totalCapital - self.investments.sum()
+        if invalidation.expectedSales:
+            self.expectedSales = None
+        return invalidation
+
+    # Log individual purchases of the following sell rounds to a transactionLog.TransactionLog (None turns logging off)
+    def setTransactionLog(self, transactionLog):
+        self.transactionLog = transactionLog
+
+    # Draw purchases in multinomial blocks (same distribution, faster when costumers buy many items)
+    def setBlockSampling(self, blockSampling):
+        self.blockSampling = blockSampling
+
+    # Split the following sell rounds into nShards shards run on nWorkers processes (None turns sharding off)
+    # Results depend on the shards but not on the workers, transaction logs are not supported for sharded rounds
+    # The worker processes are started here and reused by every sell round, setSharding(None) shuts them down
+    def setSharding(self, nShards, nWorkers=None):
+        if self.shardExecutor is not None:
+            self.shardExecutor.shutdown()
+            self.shardExecutor = None
+        self.nShards = nShards
+        self.shardWorkers = nWorkers
+        if nShards is not None and nWorkers!=1:
+            self.shardExecutor = ProcessPoolExecutor(max_workers=min(nWorkers or os.cpu_count(), nShards))
+        
+    # One sell round of the whole population for the current plan, returns sales per product
+    # progress is called with the fraction of costumers done (see demandSide.buyProductsBatch)
+    @prof.timed("sell")
+    def sell(self, rng=None, progress=None):
+        if self.nShards is not None and self.transactionLog is not None:
+            raise ValueError("Transaction logs are not supported for sharded sell rounds")
+        self.population.softReset()
+        for p in self.prodList:
+            p.setSales(0)
+        self.sellRound += 1
+        if self.transactionLog is not None:
+            self.transactionLog.setRound(self.sellRound)
+        rng = self.rng if rng is None else rng
+        if self.nShards is None:
+            self.population.buyProducts(rng, progress, self.transactionLog, self.blockSampling)
+        else:
+            prices, stock = self.getSellPrices(), np.array([p.getRemaining() for p in self.prodList])
+            bought, remBudgets = ss.sellSharded(self.population.remBudgets, self.population.probs, prices, stock, self.nShards,
+                                                rng.integers(2**63), self.shardWorkers, blockSampling=self.blockSampling, progress=progress,
+                                                executor=self.shardExecutor)
+            self.population.addPurchases(bought, remBudgets)
+        return self.getSales()
+
+    # Material and product objects by name
+    def getMaterial(self, matName):
+        return self.matList[self.registry.materials.indexOf(matName)]
+
+    def getProduct(self, prodName):
+        return self.prodList[self.registry.products.indexOf(prodName)]
+
+    # Per product arrays
+    def getProduced(self):
+        return np.array([p.getProduced() for p in self.prodList], dtype=float)
+
+    def getSales(self):
+        return np.array([p.getSales() for p in self.prodList], dtype=float)
+
+    def getCostsPerItem(self):
+        return np.array([p.materialCostPerItem for p in self.prodList], dtype=float)
+
+    def getSellPrices(self):
+        return np.array([p.getSellPrice() for p in self.prodList], dtype=float)
+
+    # Material requirements (bill of materials) as a (nProducts x nMaterials) matrix
+    def getMaterialMatrix(self):
+        return self.solver.bom.matrix
+
+    # Expected sales of a sell round for the current plan, from the mean field estimate of expectedDemand.py (no purchases are drawn)
+    # Estimated on representative costumers drawn once per population, kept until the plan changes prices or production
+    def getExpectedSales(self):
+        if self.expectedSales is None:
+            sample, weights = self.getExpectedSample()
+            self.expectedSales = ed.expectedSales(self.population.totalBudgets[sample], self.population.probs[sample], self.getSellPrices(),
+                                                  np.floor(self.getProduced()), weights=weights)[0]
+        return self.expectedSales
+
+    # Expected profit of each product: expected income minus material costs of everything produced
+    def getExpectedProfits(self):
+        return self.getSellPrices()*self.getExpectedSales() - self.getCostsPerItem()*self.getProduced()
+
+    # Representative costumers (indices, weights) of the expected sales estimate, drawn once per population
+    def getExpectedSample(self):
+        if self.expectedSample is None:
+            self.expectedSample = ed.costumerSample(self.population.totalBudgets, self.expectedSampleSize)
+        return self.expectedSample
+
+    # Relative deviation of the expected sales (as getExpectedSales estimates them) from the mean sales of stochastic
+    # sell rounds on a costumer sample
+    def compareExpectedSales(self, sampleSize=10000, nReplicas=5, seed=None):
+        return ed.compareWithSimulation(self.population.totalBudgets, self.population.probs, self.getSellPrices(),
+                                        np.floor(self.getProduced()), sampleSize, nReplicas, seed, self.getExpectedSample())
+
+    # Sweep the price of every product from low to high times its current price (nPoints points) with the other prices fixed
+    # Sales are capped by the current production if capped, otherwise all demand is served at the current costs per item
+    # (production follows the sales), see priceSweep.sweepPrices
+    # Needs a plan with a positive price for every product (ValueError otherwise)
+    def sweepPrices(self, low=0.5, high=2.0, nPoints=100, capped=False, sampleSize=10000, seed=None):
+        prices = self.getSellPrices()
+        if self.solution is None or (prices<=0).any():
+            raise ValueError("Price sweeps need a plan with positive prices for all products")
+        priceGrid = sw.relativePriceGrid(prices, low, high, nPoints)
+        produced = self.getProduced() if capped else None
+        stock = None if produced is None else np.floor(produced)
+        sales = sw.sweepPrices(self.population.totalBudgets, self.population.probs, prices, priceGrid, stock, sampleSize, seed)
+        return sw.PriceSweep(self.prodNames, prices, priceGrid, sales, self.getCostsPerItem(), produced)
+
+    # Values of the investment plan table, one array per column
+    def getPlanArrays(self):
+        produced, costs, prices = self.getProduced(), self.getCostsPerItem(), self.getSellPrices()
+        return {"Invested":self.investments, "Produced":produced, "Cost Per Item":costs, "Price Per Item":prices,
+                "Profit Per Sale":prices-costs, "Cost":costs*produced, "Price":prices*produced, "Expected Profit":self.getExpectedProfits()}
+
+    # Values of the sales table, one array per column
+    def getSalesArrays(self):
+        produced, sales, costs, prices = self.getProduced(), self.getSales(), self.getCostsPerItem(), self.getSellPrices()
+        return {"Produced":produced, "Sold":sales, "Remaining":produced-sales,
+                "Expected Profit":self.getExpectedProfits(), "Actual Profit":prices*sales-costs*produced}
+
+    # Print market state
+    def printInfo(self):
+        print("Market with {0} materials, {1} products and {2} costumers (seed: {3})".format(len(self.matList), len(self.prodList), len(self.population), self.seed))
+        print("Total capital: {0:.1f}, remaining capital: {1:.1f}".format(self.totalCapital, self.remCapital))
+        for p in self.prodList:
+            p.printInfo()
@@ -0,0 +1,95 @@
+# This file advances a market over time periods, instead of soft resetting everything for each sale
+# Unsold inventory, company capital and costumer budgets are carried from one period to the next
+# The production plan is only solved again when the (affordable) investments or the supply side change
+import numpy as np
+import demandSide as dem
+import planSolver as ps
+
+class MarketSimulation:
+
+    def __init__(self, prodList, matList, population, capital, incomeFraction=1.0, rng=None, maxBudgetFactor=2.0):
+        self.solver = ps.PlanSolver(prodList, matList)
+        self.population = population
+        self.productNames = [p.name for p in prodList]
+        self.startCapital = capital
+        # Fraction of their total budget that costumers earn each period, on top of what they did not spend
+        self.incomeFraction = incomeFraction
+        # Budgets are capped at maxBudgetFactor times the total budget (None for no cap), so savings of costumers who buy
+        # little do not pile up without bound and the budget level stays stationary over long runs
+        self.maxBudgetFactor = maxBudgetFactor
+        self.rng = dem.demRng if rng is None else rng
+        self.investments = np.zeros(len(prodList))
+        self.profitPercentages = np.zeros(len(prodList))
+        self.softReset()
+
+    # Back to period 0: full capital, no inventory, costumers with their total budgets and no history
+    def softReset(self):
+        self.period = 0
+        self.capital = self.startCapital
+        self.inventory = np.zeros(len(self.productNames), dtype=np.int64)
+        self.population.softReset()
+        self.solver.softReset()
+        self.solvedInvestments = None
+        self.history = {k:[] for k in ["produced","sales","inventory","prices","costsPerItem","revenue","materialCost","capital"]}
+
+    # Set investment and profit percentage per product, used from the next period on
+    def setPlan(self, investmentsIn, profitPercentagesIn):
+        self.investments = np.asarray(investmentsIn, dtype=float)
+        self.profitPercentages = np.asarray(profitPercentagesIn, dtype=float)
+
+    # Call after supply curves or material requirements change, so the next period solves the plan again
+    def updateSupplySide(self):
+        self.solver.softReset()
+        self.solvedInvestments = None
+
+    # Investments scaled down proportionally if the plan needs more than the available capital
+    def getAffordableInvestments(self):
+        planned = self.investments.sum()
+        if planned<=self.capital or planned<=0:
+            return self.investments
+        return self.investments*(max(self.capital,0)/planned)
+
+    # Advance one period: produce, sell new and carried items, collect revenue and carry the rest forward
+    def step(self):
+        investments = self.getAffordableInvestments()
+        # Only solve the coupled production system when the investments changed
+        if self.solvedInvestments is None or not np.array_equal(investments, self.solvedInvestments):
+            self.solver.solve(investments)
+            self.solvedInvestments = investments.copy()
+        solution = self.solver.lastSolution
+        produced = np.floor(solution.produced).astype(np.int64)
+        materialCost = float(investments.sum())
+        prices = solution.costsPerItem*(1+self.profitPercentages/100.0)
+        # Costumers earn income and buy from new and carried inventory
+        if self.period>0 and self.incomeFraction>0:
+            remBudgets = self.population.remBudgets
+            remBudgets += self.incomeFraction*self.population.totalBudgets
+            if self.maxBudgetFactor is not None:
+                np.minimum(remBudgets, self.maxBudgetFactor*self.population.totalBudgets, out=remBudgets)
+        stock = self.inventory + produced
+        bought, self.population.remBudgets[:] = dem.buyProductsBatch(self.population.remBudgets, self.population.probs, prices, stock, self.rng)
+        sales = bought.sum(axis=0)
+        revenue = float(sales @ prices)
+        self.inventory = stock - sales
+        self.capital += revenue - materialCost
+        self.period += 1
+        for k, v in zip(["produced","sales","inventory","prices","costsPerItem","revenue","materialCost","capital"],
+                        [produced, sales, self.inventory, prices, solution.costsPerItem, revenue, materialCost, self.capital]):
+            self.history[k].append(v)
+        return sales
+
+    # Run nPeriods periods
+    def run(self, nPeriods):
+        for i in range(nPeriods):
+            self.step()
+        return self.getHistory()
+
+    # History as arrays with one row per period
+    def getHistory(self):
+        return {k:np.array(v) for (k,v) in self.history.items()}
+
+    # Print state after the last period
+    def printInfo(self):
+        print("Period: {0}, capital: {1:.2f}".format(self.period, self.capital))
+        for name, inv in zip(self.productNames, self.inventory):
+            print("Product: {0}, inventory carried forward: {1}".format(name, inv))
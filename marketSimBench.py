@@ -0,0 +1,156 @@
+# Benchmarks for the simulation hot paths of marketSim
+# Times (best of repeats) and peak traced memory are recorded with fixed seeds, and written as JSON for comparing versions
+# Example: python marketSimBench.py --costumers 1000 10000 100000 1000000 --output bench.json
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import supplySide as sup
+import products as prod
+import demandSide as dem
+import planSolver as ps
+import registry as reg
+
+# Create materials, products and a costumer population from a seed
+def makeMarket(nMaterials, nProducts, nCostumers, seed):
+    matRng, prodRng, costRng = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3)]
+    matList = [sup.RawMaterial("M{0}".format(i+1)) for i in range(nMaterials)]
+    for m in matList:
+        m.setRandomSupplyPars(matRng)
+    matRegistry = reg.NameRegistry([m.name for m in matList])
+    prodList = [prod.Product("P{0}".format(i+1), matRegistry) for i in range(nProducts)]
+    for p in prodList:
+        p.setMaterialObjects(matList)
+        p.setRandomMaterialReqs(prodRng)
+    population = dem.CustomerPopulation(nCostumers, [p.name for p in prodList])
+    dem.Costumer.setRandomBudgetMean(25,5,costRng)
+    population.setProductObjects(prodList)
+    population.setRandomTotalBudgets(costRng)
+    population.setRandomProductProbabilities(costRng)
+    return matList, prodList, population
+
+# Plan with equal investments and profit percentages, applied to the product and material objects
+def applyEqualPlan(matList, prodList, capital=100000, profitPercentage=5):
+    solver = ps.PlanSolver(prodList, matList)
+    solver.solve(np.full(len(prodList), capital/len(prodList)))
+    solver.applySolution(np.full(len(prodList), profitPercentage))
+    for p in prodList:
+        p.setProduced(np.floor(p.getProduced()))
+    return solver
+
+# Time a function: setup is called before every repeat and not timed, its result is passed to func
+# Memory is traced in one extra run after the timed ones, since tracing slows down allocation heavy code
+# Returns the best time and the peak traced memory
+def timeCall(func, setup=None, repeats=3):
+    bestTime = float("inf")
+    for r in range(repeats):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        bestTime = min(bestTime, time.perf_counter() - start)
+    args = setup() if setup is not None else ()
+    tracemalloc.start()
+    try:
+        func(*args)
+        peakMemory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return bestTime, peakMemory
+
+# RawMaterial pricing: one scalar call per demand against one array call
+def benchPricing(nPoints, seed):
+    matList, prodList, population = makeMarket(2, 1, 0, seed)
+    m = matList[0]
+    demands = np.linspace(0,10000,nPoints)
+    yield "pricing.scalar", nPoints, timeCall(lambda: [m.getPriceFromDemand(d) for d in demands])
+    yield "pricing.array", nPoints, timeCall(lambda: m.getPricesFromDemands(demands))
+
+# Product material cost: per object dict walk against the bill of materials matrix
+def benchMaterialCost(nProducts, seed):
+    matList, prodList, population = makeMarket(nProducts, nProducts, 0, seed)
+    produced = np.full(nProducts, 100.0)
+    def objectPath():
+        for m in matList:
+            m.softReset()
+        for p, q in zip(prodList, produced):
+            p.setProduced(q)
+            p.incMaterialDemands()
+        return [p.getMaterialCostPerItem() for p in prodList]
+    bom = prod.BillOfMaterials(prodList, matList)
+    yield "materialCost.objects", nProducts, timeCall(objectPath)
+    yield "materialCost.matrix", nProducts, timeCall(lambda: bom.calcCosts(produced))
+
+# Population initialization with batched draws
+def benchInit(nCostumers, seed):
+    yield "market.init", nCostumers, timeCall(lambda: makeMarket(5, 5, nCostumers, seed))
+
+# Sell round of the whole population, stock is reset before every repeat
+def benchBuy(nCostumers, seed):
+    matList, prodList, population = makeMarket(5, 5, nCostumers, seed)
+    applyEqualPlan(matList, prodList, capital=20*nCostumers)
+    def setup():
+        population.softReset()
+        for p in prodList:
+            p.setSales(0)
+        return (np.random.default_rng(seed),)
+    yield "buy.population", nCostumers, timeCall(population.buyProducts, setup)
+    yield "buy.populationBlocks", nCostumers, timeCall(lambda rng: population.buyProducts(rng, blockSampling=True), setup)
+    # Object per costumer reference, only for small populations
+    if nCostumers<=10000:
+        prodRegistry = reg.NameRegistry(population.productNames)
+        costumerList = [dem.Costumer("C{0}".format(i+1), prodRegistry) for i in range(nCostumers)]
+        for i, c in enumerate(costumerList):
+            c.setProductObjects(prodList)
+            c.setTotalBudget(float(population.totalBudgets[i]))
+            c.setProductProbabilities(population.probs[i].tolist())
+        def setupList():
+            for c in costumerList:
+                c.softReset()
+            for p in prodList:
+                p.setSales(0)
+            return ()
+        yield "buy.costumerLoop", nCostumers, timeCall(lambda: [c.buyProducts() for c in costumerList], setupList, repeats=1)
+
+# Full round: solve the plan from investments, then sell to the population
+def benchRound(nCostumers, seed):
+    matList, prodList, population = makeMarket(5, 5, nCostumers, seed)
+    def fullRound():
+        population.softReset()
+        for p in prodList:
+            p.softReset()
+        applyEqualPlan(matList, prodList, capital=20*nCostumers)
+        population.buyProducts(np.random.default_rng(seed))
+    yield "round.planAndSell", nCostumers, timeCall(fullRound)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark marketSim hot paths")
+    parser.add_argument("--costumers", type=int, nargs="+", default=[1000,10000,100000,1000000])
+    parser.add_argument("--products", type=int, nargs="+", default=[5,100,1000])
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--output", default=None, help="JSON output file (default: print to stdout)")
+    args = parser.parse_args(argv)
+
+    benches = [(benchPricing, [args.points])]
+    benches += [(benchMaterialCost, args.products)]
+    benches += [(b, args.costumers) for b in (benchInit, benchBuy, benchRound)]
+    results = []
+    for bench, sizes in benches:
+        for size in sizes:
+            for name, n, (seconds, peak) in bench(size, args.seed):
+                results.append({"name":name, "size":n, "seconds":seconds, "peakMB":peak/2**20})
+                print("{0:<22} size={1:<9} {2:10.4f} s {3:10.1f} MB".format(name, n, seconds, peak/2**20), file=sys.stderr)
+    report = {"python":platform.python_version(), "numpy":np.__version__, "machine":platform.machine(),
+              "seed":args.seed, "time":time.strftime("%Y-%m-%dT%H:%M:%S"), "results":results}
+    if args.output is None:
+        print(json.dumps(report, indent=1))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    return report
+
+if __name__=="__main__":
+    main()
@@ -79,28 +79,26 @@ for i in range(len(prodList)):
 # Simulate 1000 costumers
 
 
-costumerNameList = ["C{0}".format(i+1) for i in range(10000)]
-costumerList = [dem.Costumer(s, prodNameList) for s in costumerNameList]
+costumerPop = dem.CustomerPopulation(10000, prodNameList)
 dem.Costumer.setRandomBudgetMean(15,2)
-for c in costumerList:
-    # Random initialization routine
-    c.setProductObjects(prodList)
-    c.setRandomTotalBudget()
-    c.setRandomProductProbabilities()
-    # Buy products
-    c.buyProducts()
-    # Print costumer info
-    #costumerList[i].printInfo()
+# Random initialization routine
+costumerPop.setProductObjects(prodList)
+costumerPop.setRandomTotalBudgets()
+costumerPop.setRandomProductProbabilities()
+# Buy products (whole population at once)
+costumerPop.buyProducts()
+# Print costumer info
+#costumerPop.printInfo(0)
 
 # Reprint product info after sales
 for p in prodList:
     p.printInfo()
     
 #Plot budget distribution
-#f, ax = dem.plotBudgetDist(costumerList)
+#f, ax = dem.plotBudgetDist(costumerPop)
 #plt.show()
 
-#f, ax = dem.plotBudgetPerProduct(costumerList)
+#f, ax = dem.plotBudgetPerProduct(costumerPop)
 #plt.show()
 
 # Test company class functions
@@ -131,9 +129,8 @@ productArray, argTuple = testCompany.calcProductsFromInvestment()
 testCompany.makeProducts()
 
 # Reset costumers to start, and let them buy products
-for c in costumerList:
-    c.softReset()
-    c.buyProducts()
+costumerPop.softReset()
+costumerPop.buyProducts()
 
 
 testCompany.calcProfits()
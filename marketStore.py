@@ -0,0 +1,89 @@
+# This file saves and loads market snapshots as a directory of .npy files plus a small meta.json
+# Costumer arrays are memory mapped on load, so large populations load without reading them and workers can share one copy on disk
+# Copy on write mapping (the default) lets the loaded market sell without changing the files, "r" maps budgets and
+# probabilities read only and reads the sell state (remaining budgets, bought counts) into writable memory, so it can sell too
+import json
+import os
+import numpy as np
+import demandSide as dem
+import market as mk
+
+# Arrays stored per snapshot, besides the costumer arrays
+marketArrayNames = ["supplyPars","materialMatrix","matDemands","matPrices","investments","profitPercentages",
+                    "produced","costsPerItem","sellPrices","sales"]
+costumerArrayNames = ["totalBudgets","remBudgets","probs","bought"]
+statsArrayNames = ["statsEdges","statsCounts","statsProductBudgets"]
+
+# Save market parameters, company plan, production and sales, and the costumer population to directory path
+def saveMarket(market, path):
+    os.makedirs(path, exist_ok=True)
+    population = market.population
+    stats = population.budgetStats
+    arrays = {
+        "supplyPars":np.array([m.getSupplyPars() for m in market.matList], dtype=float),
+        "materialMatrix":market.getMaterialMatrix(),
+        "matDemands":np.array([m.demanded for m in market.matList], dtype=float),
+        "matPrices":np.array([m.price for m in market.matList], dtype=float),
+        "investments":market.investments,
+        "profitPercentages":market.profitPercentages,
+        "produced":market.getProduced(),
+        "costsPerItem":market.getCostsPerItem(),
+        "sellPrices":market.getSellPrices(),
+        "sales":market.getSales(),
+        "totalBudgets":population.totalBudgets,
+        "remBudgets":population.remBudgets,
+        "probs":population.probs,
+        "bought":population.bought,
+        "statsEdges":stats.edges,
+        "statsCounts":stats.counts,
+        "statsProductBudgets":stats.productBudgets,
+    }
+    for k, v in arrays.items():
+        np.save(os.path.join(path, k+".npy"), np.asarray(v))
+    meta = {"matNames":market.matNames, "prodNames":market.prodNames, "nCostumers":len(population),
+            "totalCapital":market.totalCapital, "remCapital":market.remCapital, "seed":market.seed,
+            "budgetMean":market.budgetMean, "budgetMeanPars":list(market.budgetMeanPars),
+            "rngState":market.rng.bit_generator.state, "statsBins":stats.nBins}
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+# Load a market saved with saveMarket, costumer arrays are memory mapped with mmapMode (None reads them into memory)
+def loadMarket(path, mmapMode="c"):
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = {k:np.load(os.path.join(path, k+".npy")) for k in marketArrayNames+statsArrayNames}
+    arrays.update({k:np.load(os.path.join(path, k+".npy"), mmap_mode=mmapMode) for k in costumerArrayNames})
+    # Sell rounds write remaining budgets and bought counts
+    if mmapMode=="r":
+        arrays["remBudgets"], arrays["bought"] = np.array(arrays["remBudgets"]), np.array(arrays["bought"])
+    # Costumers with precomputed budget statistics
+    stats = dem.BudgetStats(len(meta["prodNames"]), meta["statsBins"])
+    stats.nCostumers = meta["nCostumers"]
+    stats.edges, stats.counts, stats.productBudgets = arrays["statsEdges"], arrays["statsCounts"], arrays["statsProductBudgets"]
+    stats.totalBudget = float(stats.productBudgets.sum())
+    population = dem.CustomerPopulation.fromArrays(meta["prodNames"], arrays["totalBudgets"], arrays["probs"],
+                                                   arrays["remBudgets"], arrays["bought"], stats)
+    market = mk.Market(meta["matNames"], meta["prodNames"], meta["nCostumers"], meta["totalCapital"], meta["seed"],
+                       meta["budgetMean"], meta["budgetMeanPars"][1], population)
+    market.budgetMeanPars = tuple(meta["budgetMeanPars"])
+    market.rng.bit_generator.state = meta["rngState"]
+    # Supply side and material requirements
+    for m, pars, d, pr in zip(market.matList, arrays["supplyPars"], arrays["matDemands"], arrays["matPrices"]):
+        m.updateSupplyPars(*pars.tolist())
+        m.setDemand(float(d))
+        m.price = float(pr)
+    for p, reqs in zip(market.prodList, arrays["materialMatrix"]):
+        p.setMaterialReqs([int(r) if float(r).is_integer() else float(r) for r in reqs])
+    market.solver.softReset()
+    # Company plan, production and sales
+    market.investments = arrays["investments"]
+    market.profitPercentages = arrays["profitPercentages"]
+    market.remCapital = meta["remCapital"]
+    for j, p in enumerate(market.prodList):
+        p.setProduced(float(arrays["produced"][j]))
+        p.materialCostPerItem = float(arrays["costsPerItem"][j])
+        p.getTotalMaterialCost()
+        p.sellPrice = float(arrays["sellPrices"][j])
+        p.profitPerItem = p.sellPrice - p.materialCostPerItem
+        p.setSales(float(arrays["sales"][j]))
+    return market
@@ -0,0 +1,135 @@
+# This file searches investment splits of the company capital and per product profit percentages for the best expected profit
+# Candidate plans are evaluated in batches: production is solved for each plan, then all plans sell to copies of the same
+# costumers in one vectorized engine run. Every evaluation uses the same random streams (common random numbers),
+# so plans are compared on the same purchase draws, evaluations are deterministic and repeated plans are served from a cache
+# The search is a cross entropy method: investment splits are drawn from a Dirichlet distribution (with an unspent share)
+# and profit percentages from a clipped normal distribution, both moved towards the best plans of every iteration
+import numpy as np
+import planSolver as ps
+import demandSide as dem
+
+# Sell rounds of several plans (rows of prices and stock, (nPlans, nProducts)) to independent copies of the same costumers
+# Each plan sells as in demandSide.buyProductsBatch, all plans are resolved together in every round of demandSide.buyOneItemRound
+# With commonDraws, a costumer uses the same random number in a given round for every plan (common random numbers),
+# so differences between plans come from the plans and not from the draws
+# Returns sales (nPlans, nProducts)
+def sellPlansBatch(budgets, probs, prices, stock, rng, commonDraws=False):
+    nCostumers = len(budgets)
+    nPlans, nProducts = np.shape(prices)
+    prices = np.asarray(prices, dtype=float)
+    probs = np.asarray(probs)
+    startStock = np.array(stock, dtype=np.int64).reshape(nPlans,nProducts)
+    stock = startStock.copy()
+    remBudgets = np.tile(np.asarray(budgets, dtype=float), nPlans)
+    # Active (plan, costumer) pairs as plan*nCostumers+costumer, in population order within each plan
+    active = np.flatnonzero(np.tile(probs.sum(axis=1)>0, nPlans))
+    while active.size>0:
+        active = dem.buyOneItemRound(active, remBudgets, probs, prices, stock, None, rng, commonDraws=commonDraws)
+    return startStock - stock
+
+# Best plan found by PlanOptimizer.optimize, with the best expected profit of every iteration
+class OptimizedPlan:
+
+    def __init__(self, investments, profitPercentages, expectedProfit, history, nEvaluations, cacheHits):
+        self.investments = investments
+        self.profitPercentages = profitPercentages
+        self.expectedProfit = expectedProfit
+        self.history = history
+        self.nEvaluations = nEvaluations
+        self.cacheHits = cacheHits
+
+    def printInfo(self):
+        print("Expected profit: {0:.2f} after {1} evaluations ({2} cached)".format(self.expectedProfit, self.nEvaluations, self.cacheHits))
+        print("Investments: {0}".format(np.round(self.investments,1)))
+        print("Profit percentages: {0}".format(np.round(self.profitPercentages,1)))
+
+# Plan search for the company of a market.Market (its products, materials, costumers and capital)
+# With sampleSize, plans sell to a fixed random sample of the costumers with the stock scaled down by the same fraction,
+# and sales are scaled back up, which keeps evaluations of large populations cheap
+# nReplicas sell rounds (with fixed seeds) are averaged for every plan
+class PlanOptimizer:
+
+    def __init__(self, market, sampleSize=None, nReplicas=1, seed=0, maxProfitPercentage=100):
+        self.market = market
+        self.bom = market.solver.bom
+        self.capital = market.totalCapital
+        self.maxProfitPercentage = maxProfitPercentage
+        self.seedSeq = np.random.SeedSequence(seed)
+        sampleSeed, *self.replicaSeeds = self.seedSeq.spawn(nReplicas+1)
+        sampleRng = np.random.default_rng(sampleSeed)
+        population = market.population
+        nCostumers = len(population)
+        if sampleSize is None or sampleSize>=nCostumers:
+            sample = np.arange(nCostumers)
+        else:
+            sample = np.sort(sampleRng.choice(nCostumers, sampleSize, replace=False))
+        self.sampleFraction = len(sample)/max(nCostumers,1)
+        self.budgets = np.asarray(population.totalBudgets[sample], dtype=float)
+        self.probs = np.asarray(population.probs[sample])
+        self.cache = {}
+        self.nEvaluations = 0
+        self.cacheHits = 0
+
+    # Drop cached evaluations, call after the market changed
+    def clearCache(self):
+        self.cache = {}
+
+    # Cache key of a plan, rounded so that plans equal up to rounding noise share an entry
+    def planKey(self, investments, profitPercentages):
+        return np.round(np.concatenate((investments, profitPercentages)), 6).tobytes()
+
+    # Expected profit of each plan, investments and profitPercentages are (nPlans, nProducts)
+    # Profit is income of sold items minus material costs of everything produced, as in Market.getSalesArrays
+    def evaluate(self, investments, profitPercentages):
+        investments = np.atleast_2d(np.asarray(investments, dtype=float))
+        profitPercentages = np.atleast_2d(np.asarray(profitPercentages, dtype=float))
+        keys = [self.planKey(i, p) for (i, p) in zip(investments, profitPercentages)]
+        profits = np.array([self.cache.get(k, np.nan) for k in keys])
+        missing = np.flatnonzero(np.isnan(profits))
+        self.cacheHits += len(keys)-len(missing)
+        # Repeated plans within the batch are only evaluated once
+        uniqueKeys = {}
+        for i in missing:
+            uniqueKeys.setdefault(keys[i], i)
+        rows = list(uniqueKeys.values())
+        if rows:
+            solutions = [ps.solveProduction(self.bom, investments[i]) for i in rows]
+            produced = np.array([s.produced for s in solutions])
+            costs = np.array([s.costsPerItem for s in solutions])
+            prices = costs*(1+profitPercentages[rows]/100.0)
+            stock = np.floor(produced*self.sampleFraction)
+            sales = np.mean([sellPlansBatch(self.budgets, self.probs, prices, stock, np.random.default_rng(s)) for s in self.replicaSeeds], axis=0)
+            newProfits = sales/self.sampleFraction*prices - produced*costs
+            for i, profit in zip(rows, newProfits.sum(axis=1)):
+                self.cache[keys[i]] = profit
+            self.nEvaluations += len(rows)
+        return np.array([self.cache[k] for k in keys])
+
+    # Cross entropy search: nIterations rounds of nCandidates plans, the best eliteFraction of them update the search distributions
+    # Starts from an equal split of all capital and profitPercentage, the best plan so far is always kept as a candidate
+    def optimize(self, nIterations=20, nCandidates=64, eliteFraction=0.2, profitPercentage=20.0, concentration=10.0, seed=None):
+        rng = np.random.default_rng(self.seedSeq.spawn(1)[0] if seed is None else seed)
+        nProducts = len(self.market.prodList)
+        nElite = max(int(nCandidates*eliteFraction), 2)
+        # Mean split of the capital over products and an unspent share (last), mean and spread of profit percentages
+        splitMean = np.append(np.full(nProducts, 1.0/nProducts), 1e-3)
+        splitMean /= splitMean.sum()
+        pctMean = np.full(nProducts, float(profitPercentage))
+        pctSpread = np.full(nProducts, self.maxProfitPercentage/4.0)
+        bestSplit, bestPcts = splitMean, pctMean
+        bestProfit = self.evaluate(self.capital*bestSplit[None,:-1], bestPcts[None])[0]
+        history = [bestProfit]
+        for it in range(nIterations):
+            splits = rng.dirichlet(np.maximum(splitMean*concentration, 1e-3), nCandidates-1)
+            pcts = np.clip(rng.normal(pctMean, pctSpread, (nCandidates-1,nProducts)), 0, self.maxProfitPercentage)
+            splits, pcts = np.vstack((bestSplit, splits)), np.vstack((bestPcts, pcts))
+            profits = self.evaluate(self.capital*splits[:,:-1], pcts)
+            elite = np.argsort(-profits, kind="stable")[:nElite]
+            if profits[elite[0]]>bestProfit:
+                bestProfit, bestSplit, bestPcts = profits[elite[0]], splits[elite[0]], pcts[elite[0]]
+            splitMean = 0.7*splits[elite].mean(axis=0) + 0.3*splitMean
+            pctMean = 0.7*pcts[elite].mean(axis=0) + 0.3*pctMean
+            pctSpread = np.maximum(0.7*pcts[elite].std(axis=0) + 0.3*pctSpread, 0.5)
+            concentration *= 1.3
+            history.append(bestProfit)
+        return OptimizedPlan(self.capital*bestSplit[:-1], bestPcts, bestProfit, history, self.nEvaluations, self.cacheHits)
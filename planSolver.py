@@ -0,0 +1,104 @@
+# This file solves production quantities from investments
+# Material prices depend on the total demand of all products, so the produced quantities q satisfy the coupled system
+# q_p * cost_p(q) = investment_p, with cost = B @ P(q @ B) for bill of materials B and power law supply curves P
+import numpy as np
+import products as prod
+import profiling as prof
+
+# Result of a production solve, with convergence information
+class PlanSolution:
+
+    def __init__(self, produced, matDemands, matPrices, costsPerItem, converged, iterations, residual):
+        self.produced = produced
+        self.matDemands = matDemands
+        self.matPrices = matPrices
+        self.costsPerItem = costsPerItem
+        self.converged = converged
+        self.iterations = iterations
+        self.residual = residual
+
+    # Print solution status
+    def printInfo(self):
+        print("Converged: {0}, iterations: {1}, max residual: {2:.3e}".format(self.converged, self.iterations, self.residual))
+        print("Produced: {0}".format(np.round(self.produced,3)))
+        print("Cost per item: {0}".format(np.round(self.costsPerItem,3)))
+
+# Residual of the investment system: money spent on each product minus its investment
+def investmentResidual(bom, produced, investments):
+    matDemands, matPrices, costsPerItem = bom.calcCosts(produced)
+    return produced*costsPerItem - investments, matDemands, matPrices, costsPerItem
+
+# Analytic jacobian of investmentResidual: diag(cost) + diag(q) B diag(P'(D)) B^T
+def investmentJacobian(bom, produced, matDemands, costsPerItem):
+    # Derivative of the power law supply curves, zero for materials without demand (their products are not produced)
+    safeDemands = np.where(matDemands>0, matDemands, 1.0)
+    dPrices = np.where(matDemands>0, bom.supCoeffs*bom.supExps*np.power(safeDemands,bom.supExps-1), 0.0)
+    return np.diag(costsPerItem) + (produced[:,None]*bom.matrix) @ (dPrices[:,None]*bom.matrix.T)
+
+# Damped Newton solver for produced quantities, starting from warmStart if given
+# Converges when every residual is below tol relative to its investment (or absolute tol for zero investments)
+@prof.timed("solver")
+def solveProduction(bom, investments, warmStart=None, tol=1e-9, maxIter=50):
+    investments = np.asarray(investments, dtype=float)
+    # Products without investment or material requirements are not produced
+    active = (investments>0) & (bom.matrix.sum(axis=1)>0)
+    if warmStart is None:
+        # Material costs only grow with demand, so investment over the cost at zero demand is an upper bound
+        baseCosts = bom.getCostsPerItem(bom.supInters)
+        produced = np.where(active, investments/np.where(active,baseCosts,1.0), 0.0)
+    else:
+        produced = np.where(active, np.maximum(np.asarray(warmStart, dtype=float),0), 0.0)
+    scale = np.maximum(investments, 1.0)
+    residual, matDemands, matPrices, costsPerItem = investmentResidual(bom, produced, investments)
+    residual[~active] = 0
+    error = np.max(np.abs(residual)/scale, initial=0.0)
+    iterations = 0
+    while error>tol and iterations<maxIter:
+        iterations += 1
+        jac = investmentJacobian(bom, produced, matDemands, costsPerItem)[np.ix_(active,active)]
+        step = np.zeros_like(produced)
+        step[active] = np.linalg.solve(jac, -residual[active])
+        # Backtrack to keep quantities non negative and reduce the residual
+        alpha = 1.0
+        while True:
+            trial = np.maximum(produced+alpha*step, 0)
+            trialResidual, trialDemands, trialPrices, trialCosts = investmentResidual(bom, trial, investments)
+            trialResidual[~active] = 0
+            trialError = np.max(np.abs(trialResidual)/scale, initial=0.0)
+            if trialError<error or alpha<1e-6:
+                break
+            alpha *= 0.5
+        produced, residual, matDemands, matPrices, costsPerItem, error = trial, trialResidual, trialDemands, trialPrices, trialCosts, trialError
+    prof.count("solverIterations", iterations)
+    return PlanSolution(produced, matDemands, matPrices, costsPerItem, error<=tol, iterations, error)
+
+# Production planner for a product/material market, keeps the last solution to warm start the next one
+class PlanSolver:
+
+    def __init__(self, prodList, matList, tol=1e-9, maxIter=50):
+        self.bom = prod.BillOfMaterials(prodList, matList)
+        self.tol = tol
+        self.maxIter = maxIter
+        self.lastSolution = None
+        # Counts bill of materials rebuilds, so objects derived from it (see incrementalPlan.py) can tell when they are stale
+        self.bomVersion = 0
+
+    # Forget the last solution, call after the supply curves or material requirements change
+    def softReset(self):
+        self.bom.updateMaterialReqs()
+        self.bom.updateSupplyPars()
+        self.lastSolution = None
+        self.bomVersion += 1
+
+    # Solve produced quantities for the investments, warm started from the previous plan if there is one
+    def solve(self, investments, warmStart=True):
+        startPoint = self.lastSolution.produced if (warmStart and self.lastSolution is not None) else None
+        self.lastSolution = solveProduction(self.bom, investments, startPoint, self.tol, self.maxIter)
+        return self.lastSolution
+
+    # Write the last solution to the product and material objects and set profit percentages on top of the material costs
+    def applySolution(self, profitPercentages=None):
+        self.bom.applyProduction(self.lastSolution.produced)
+        if profitPercentages is not None:
+            for p, pct in zip(self.bom.prodList, profitPercentages):
+                p.setProfitPercentage(pct)
@@ -0,0 +1,64 @@
+# This file caches rendered plots keyed on the data they show, so a plot is only drawn and rasterized when its inputs change
+# Keys are built from plain values (supply parameters, demand, ...) and content hashes of arrays (budgets, probabilities)
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+# Content hash of numpy arrays (including dtype and shape), small enough to be used in cache keys
+def arrayKey(*arrays):
+    h = hashlib.blake2b(digest_size=16)
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update("{0}{1}".format(a.dtype, a.shape).encode())
+        h.update(a.data)
+    return h.hexdigest()
+
+# Least recently used cache of rendered plots, the oldest image is deleted when there are more than maxEntries
+# Plots are rasterized once to a PNG file and the figure is closed right away, so cached entries are plain files that no
+# renderer can change (live figures get resized and closed by the renderer) and a hit skips the rasterization
+class ImageCache:
+
+    def __init__(self, maxEntries=32, dpi=100, directory=None):
+        self.maxEntries = maxEntries
+        self.dpi = dpi
+        self.directory = tempfile.mkdtemp(prefix="marketSimPlots") if directory is None else directory
+        self.images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.images)
+
+    # Return a copy of the image data (src path, width and height in pixels) for key, renderers may change the copy
+    # makeFigure() (returning fig, ax like the plot functions) is only called on a miss
+    def getImage(self, key, makeFigure):
+        if key in self.images:
+            self.hits += 1
+            self.images.move_to_end(key)
+            return dict(self.images[key])
+        self.misses += 1
+        import matplotlib.pyplot as plt
+        fig, ax = makeFigure()
+        width, height = fig.get_size_inches()*self.dpi
+        path = os.path.join(self.directory, "{0}.png".format(hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()))
+        try:
+            fig.savefig(path, format="png", dpi=self.dpi)
+        finally:
+            plt.close(fig)
+        self.images[key] = {"src":path, "width":int(width), "height":int(height)}
+        while len(self.images)>self.maxEntries:
+            self.removeImage(self.images.popitem(last=False)[1])
+        return dict(self.images[key])
+
+    # Drop all cached images
+    def clear(self):
+        while self.images:
+            self.removeImage(self.images.popitem()[1])
+
+    def removeImage(self, image):
+        try:
+            os.remove(image["src"])
+        except FileNotFoundError:
+            pass
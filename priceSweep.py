@@ -0,0 +1,95 @@
+# This file sweeps the price of every product over a grid and records the sales of all products, giving demand curves,
+# elasticities and profits per price point. All grid points sell to the same costumers in batched sell rounds with
+# common random numbers (planOptimizer.sellPlansBatch), so neighbouring grid points differ by the price and not by the draws
+# Only the swept product changes price in a grid point, the other products keep their base prices
+import numpy as np
+import planOptimizer as po
+
+# Price grid (nProducts, nPoints) from low to high times the base prices
+def relativePriceGrid(prices, low=0.5, high=2.0, nPoints=100):
+    return np.asarray(prices, dtype=float)[:,None]*np.linspace(low, high, nPoints)
+
+# Sales of all products (nProducts, nPoints, nProducts) for the price grid of each product (first index)
+# produced is the fixed production of a capped sweep, None when production follows the sales
+class PriceSweep:
+
+    def __init__(self, productNames, basePrices, priceGrid, sales, costsPerItem, produced=None):
+        self.productNames = productNames
+        self.basePrices = basePrices
+        self.priceGrid = priceGrid
+        self.sales = sales
+        self.costsPerItem = costsPerItem
+        self.produced = produced
+
+    # Sales of each product over its own price grid (nProducts, nPoints)
+    def getDemandCurves(self):
+        return np.einsum("jgj->jg", self.sales)
+
+    # Own price elasticities d log(sales) / d log(price) along the grid of each product (nProducts, nPoints)
+    def getElasticities(self):
+        return self.getCrossElasticities()[np.arange(len(self.basePrices)),:,np.arange(len(self.basePrices))]
+
+    # Elasticities of the sales of every product (last index) to the price of the swept product (first index)
+    # Zero sales give undefined (nan) elasticities
+    def getCrossElasticities(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logSales = np.log(np.where(self.sales>0, self.sales, np.nan))
+            return np.gradient(logSales, axis=1)/np.gradient(np.log(self.priceGrid), axis=1)[:,:,None]
+
+    # Total profit of all products for every grid point (nProducts, nPoints): income of sold items minus costs of everything produced
+    # (of the sold items when production follows the sales)
+    def getProfits(self):
+        nProducts = len(self.basePrices)
+        prices = np.broadcast_to(self.basePrices, self.sales.shape).copy()
+        prices[np.arange(nProducts),:,np.arange(nProducts)] = self.priceGrid
+        if self.produced is None:
+            return (self.sales*(prices-self.costsPerItem)).sum(axis=2)
+        return (self.sales*prices).sum(axis=2) - np.dot(self.costsPerItem, self.produced)
+
+    # Grid price with the highest total profit for each product, when only that product changes price
+    def getBestPrices(self):
+        return self.priceGrid[np.arange(len(self.basePrices)),np.argmax(self.getProfits(), axis=1)]
+
+    # Print elasticities at the grid points closest to the base prices
+    def printInfo(self):
+        nearest = np.argmin(np.abs(self.priceGrid-self.basePrices[:,None]), axis=1)
+        elasticities = self.getElasticities()
+        bestPrices = self.getBestPrices()
+        for j, name in enumerate(self.productNames):
+            print("Product: {0}, price: {1:.2f}, elasticity: {2:.3f}, best price for profit: {3:.2f}".format(
+                name, self.basePrices[j], elasticities[j,nearest[j]], bestPrices[j]))
+
+# Sweep each product's price over priceGrid (nProducts, nPoints) with the other prices at prices
+# Without stock all costumer demand is served (pure demand curves), otherwise stock (nProducts,) caps every grid point
+# Run time grows with costumers times grid points times items bought, so by default a fixed random sample of sampleSize
+# costumers is used (None for all), with the stock scaled down and sales scaled back up. A 100 point grid for 5 products
+# takes seconds with the default sample
+# Grid points are sold plansPerBatch at a time to bound memory, every batch restarts the same random stream
+# Base and grid prices must be positive, a ValueError is raised otherwise
+# Returns sales (nProducts, nPoints, nProducts)
+def sweepPrices(budgets, probs, prices, priceGrid, stock=None, sampleSize=10000, seed=None, plansPerBatch=50):
+    prices = np.asarray(prices, dtype=float)
+    priceGrid = np.asarray(priceGrid, dtype=float)
+    # Costumers never run out of budget for free items, so unlimited stock would never sell out, and log prices need positive prices
+    if (prices<=0).any() or (priceGrid<=0).any():
+        raise ValueError("Price sweeps need positive base and grid prices")
+    nProducts, nPoints = priceGrid.shape
+    sampleSeed, drawSeed = np.random.SeedSequence(seed).spawn(2)
+    if sampleSize is None or sampleSize>=len(budgets):
+        sample = np.arange(len(budgets))
+    else:
+        sample = np.sort(np.random.default_rng(sampleSeed).choice(len(budgets), sampleSize, replace=False))
+    fraction = len(sample)/len(budgets)
+    budgets, probs = np.asarray(budgets[sample], dtype=float), np.asarray(probs[sample])
+    # One plan per (product, grid point)
+    planPrices = np.tile(prices, (nProducts*nPoints,1))
+    planPrices[np.arange(nProducts*nPoints),np.repeat(np.arange(nProducts),nPoints)] = priceGrid.ravel()
+    if stock is None:
+        planStock = np.full(planPrices.shape, np.iinfo(np.int64).max//2, dtype=np.int64)
+    else:
+        planStock = np.tile(np.floor(np.asarray(stock, dtype=float)*fraction).astype(np.int64), (nProducts*nPoints,1))
+    sales = np.zeros(planPrices.shape)
+    for start in range(0, len(planPrices), plansPerBatch):
+        batch = slice(start, start+plansPerBatch)
+        sales[batch] = po.sellPlansBatch(budgets, probs, planPrices[batch], planStock[batch], np.random.default_rng(drawSeed), commonDraws=True)
+    return sales.reshape(nProducts,nPoints,nProducts)/fraction
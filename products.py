@@ -1,14 +1,18 @@
 # This file handles the product properties and functions
 import numpy as np
-import matplotlib.pyplot as plt
 import supplySide as sup
+import profiling as prof
+import registry as reg
 
 
 prodSeed = 122807528840384100672342237672332433418
 prodRng = np.random.default_rng(prodSeed)
 
 # Product class
+# Material requirements and objects are lists ordered by the material registry (materialNamesIn can be a list of names or a registry.NameRegistry)
 class Product:
+    __slots__ = ("name", "matRegistry", "materialReqs", "matObjects", "materialTypeCtr", "produced", "materialCostPerItem",
+                 "totalMaterialCost", "sellPrice", "profitPerItem", "sales")
     # Number of products
     nProducts = 0
     # Initialize
@@ -27,32 +31,50 @@ class Product:
         self.profitPerItem = 0
         self.sales = 0
     
-    # Prepare dictionary keys based on available raw materials
+    # Prepare requirement and object lists based on available raw materials
     def materialKeys(self, materialNames):
-        self.materialDict = dict.fromkeys(materialNames,0)
-        self.matObjectDict = dict.fromkeys(materialNames,[])
+        self.matRegistry = reg.asRegistry(materialNames)
+        self.materialReqs = [0]*len(self.matRegistry)
+        self.matObjects = [None]*len(self.matRegistry)
         
-    # Prepare dictionary values based on required materials
+    # Set required materials, in material registry order
     def setMaterialReqs(self, materialReqs):
-        self.materialDict = {k:v for (k,v) in zip(self.materialDict.keys(),materialReqs)}
+        self.materialReqs = list(materialReqs)[:len(self.matRegistry)]
     
-    # Set raw material objects (which should be created earlier)
+    # Set raw material objects (which should be created earlier), in material registry order
     def setMaterialObjects(self, matObjects):
-        self.matObjectDict = {k:v for (k,v) in zip(self.matObjectDict.keys(),matObjects)}
+        self.matObjects = list(matObjects)[:len(self.matRegistry)]
+    
+    # Name based views of the requirements and material objects
+    @property
+    def materialDict(self):
+        return dict(zip(self.matRegistry.names,self.materialReqs))
+    
+    @property
+    def matObjectDict(self):
+        return dict(zip(self.matRegistry.names,self.matObjects))
+    
+    # Requirement and object of a material by name
+    def getMaterialReq(self, matName):
+        return self.materialReqs[self.matRegistry.indexOf(matName)]
+    
+    def getMaterialObject(self, matName):
+        return self.matObjects[self.matRegistry.indexOf(matName)]
         
-    # Set required materials randomly
-    def setRandomMaterialReqs(self):
+    # Set required materials randomly (from prodRng unless another generator is given)
+    def setRandomMaterialReqs(self, rng=None):
+        rng = prodRng if rng is None else rng
         #Reset current values to 0
-        self.materialDict = dict.fromkeys(list(self.materialDict.keys()),0)
+        self.materialReqs = [0]*len(self.matRegistry)
         # Determine the number of required material types: either 1 or 2 (only if there are 2 or more material types available)
-        self.materialTypeCtr = prodRng.integers(1,max(3,len(self.materialDict)+1))
+        self.materialTypeCtr = rng.integers(1,max(3,len(self.materialReqs)+1))
         # Determine which raw materials by shuffling and taking first elements:
-        materialListTemp = [k for k in self.materialDict]
-        prodRng.shuffle(materialListTemp)
+        materialListTemp = list(range(len(self.materialReqs)))
+        rng.shuffle(materialListTemp)
         # Update first element (and second element if there are two required material types) by a random integer between 1 to 3 inclusive
-        self.materialDict[materialListTemp[0]] = prodRng.integers(1,4)
+        self.materialReqs[materialListTemp[0]] = rng.integers(1,4)
         if self.materialTypeCtr>1:
-            self.materialDict[materialListTemp[1]] = prodRng.integers(1,4)
+            self.materialReqs[materialListTemp[1]] = rng.integers(1,4)
 
     # Increase produced amount
     def increaseProduced(self, produceInc):
@@ -68,12 +90,14 @@ class Product:
     
     # Add demands to the appropriate raw materials    
     def incMaterialDemands(self):
-        for k in self.matObjectDict:
-            self.matObjectDict[k].increaseDemand(self.produced*self.materialDict[k])
+        prof.count("materialDemandCalls")
+        for req, mat in zip(self.materialReqs, self.matObjects):
+            if req!=0:
+                mat.increaseDemand(self.produced*req)
     
     # Calculate product cost per item, based on raw material prices which are determined once demands from all products are entered to each raw material type
     def getMaterialCostPerItem(self):
-        self.materialCostPerItem = sum([self.materialDict[k]*self.matObjectDict[k].getPrice() for k in self.materialDict])
+        self.materialCostPerItem = sum([req*mat.getPrice() for (req, mat) in zip(self.materialReqs, self.matObjects) if req!=0])
         return self.materialCostPerItem
     
     # Total product costs
@@ -137,12 +161,70 @@ class Product:
         print("Product name is:{0}".format(self.name))
         print("Total produced quantity: {0}".format(self.produced))
         print("Raw material requirements per item are:")
-        for k in self.materialDict:
-            print("Material: {0}, Requirement: {1}, Cost Per Required Material: {2:.3f}".format(k,self.materialDict[k],self.matObjectDict[k].getPrice()))
+        for k, req, mat in zip(self.matRegistry.names, self.materialReqs, self.matObjects):
+            print("Material: {0}, Requirement: {1}, Cost Per Required Material: {2:.3f}".format(k,req,mat.getPrice()))
         print("Cost per product: {0:.3f}, and cost for all products: {1:.3f}".format(self.materialCostPerItem, self.totalMaterialCost))
         print("Designated profit per item: {0:.4f}. Corresponding price per item: {1:.3f}".format(self.profitPerItem,self.sellPrice))
         print('Total potential profit (if all products are sold): {0:.3f}. Corresponding total price: {1:.3f}'.format(self.getPotTotalProfit(),self.getPotTotalPrice()))
         print('Total actual profit (based on actual sold products): {0:.3f}. Corresponding total price: {1:.3f}'.format(self.getTotalProfit(),self.getTotalPrice()))
         print('Produced: {0}, Sold:{1}, Remaining:{2}'.format(self.produced,self.sales,self.getRemaining()))
+
+
+# Market level bill of materials: material requirements of all products as a (nProducts x nMaterials) matrix
+# Total material demand is produced @ matrix, and costs per item are matrix @ material prices
+class BillOfMaterials:
+    
+    def __init__(self, prodList, matList):
+        self.prodList = list(prodList)
+        self.matList = list(matList)
+        self.productNames = [p.name for p in self.prodList]
+        self.materialNames = [m.name for m in self.matList]
+        self.updateMaterialReqs()
+        self.updateSupplyPars()
         
-        
\ No newline at end of file
+    # Rebuild the matrix from the product material requirements (call after changing them)
+    def updateMaterialReqs(self):
+        self.matrix = np.zeros((len(self.prodList),len(self.matList)))
+        for i, p in enumerate(self.prodList):
+            if p.matRegistry.names==self.materialNames:
+                self.matrix[i] = p.materialReqs
+            else:
+                for k, v in zip(p.matRegistry.names, p.materialReqs):
+                    if v!=0:
+                        self.matrix[i,self.materialNames.index(k)] = v
+        
+    # Refresh supply parameter arrays from the materials (call after changing supply curves)
+    def updateSupplyPars(self):
+        self.supCoeffs, self.supExps, self.supInters = sup.getSupplyParArrays(self.matList)
+    
+    # Total demand for each material from the production vector
+    @prof.timed("materialDemand")
+    def getMaterialDemands(self, produced):
+        return np.asarray(produced, dtype=float) @ self.matrix
+    
+    # Price of each material for the given material demands
+    @prof.timed("materialPricing")
+    def getMaterialPrices(self, matDemands):
+        return sup.supplyPrices(self.supCoeffs, self.supExps, self.supInters, matDemands)
+    
+    # Material cost per item of each product for the given material prices
+    def getCostsPerItem(self, matPrices):
+        return self.matrix @ matPrices
+    
+    # Material demands, material prices and costs per item for a production vector
+    def calcCosts(self, produced):
+        matDemands = self.getMaterialDemands(produced)
+        matPrices = self.getMaterialPrices(matDemands)
+        return matDemands, matPrices, self.getCostsPerItem(matPrices)
+    
+    # Set production of all products and write the resulting demands, prices and costs to the material and product objects
+    def applyProduction(self, produced):
+        matDemands, matPrices, costsPerItem = self.calcCosts(produced)
+        for m, d, pr in zip(self.matList, matDemands, matPrices):
+            m.setDemand(d)
+            m.price = pr
+        for p, q, c in zip(self.prodList, produced, costsPerItem):
+            p.setProduced(q)
+            p.materialCostPerItem = c
+            p.getTotalMaterialCost()
+        return costsPerItem
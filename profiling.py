@@ -0,0 +1,85 @@
+# This file provides named timers and counters for the simulation stages (purchasing, pricing, solver, ...)
+# Profiling is off by default, then timed functions and counters only check one flag
+# Timers and counters are process wide, so the report covers all markets of the process
+import functools
+import json
+import time
+
+enabled = False
+# name -> [number of calls, total seconds]
+timers = {}
+# name -> count
+counters = {}
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+# Forget all timings and counts
+def reset():
+    timers.clear()
+    counters.clear()
+
+# Add n to a named counter (for example purchase rounds or random draws)
+def count(name, n=1):
+    if enabled:
+        counters[name] = counters.get(name,0) + n
+
+# Add a timing to a named timer
+def addTime(name, seconds):
+    entry = timers.setdefault(name, [0,0.0])
+    entry[0] += 1
+    entry[1] += seconds
+
+# Context manager timing a block of code under name: with prof.Timer("stage"):
+class Timer:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            addTime(self.name, time.perf_counter()-self.start)
+
+# Decorator timing every call of a function under name
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                addTime(name, time.perf_counter()-start)
+        return wrapper
+    return decorator
+
+# Timers (calls, total and mean seconds) and counters as a dictionary
+def getReport():
+    return {"timers":{k:{"calls":c, "seconds":s, "meanSeconds":s/c if c>0 else 0.0} for (k,(c,s)) in sorted(timers.items())},
+            "counters":dict(sorted(counters.items()))}
+
+# Report as printable lines, timers sorted by total time
+def formatReport():
+    report = getReport()
+    lines = ["{0:<24} calls: {1:<8} total: {2:10.4f} s mean: {3:10.6f} s".format(k, v["calls"], v["seconds"], v["meanSeconds"])
+             for (k,v) in sorted(report["timers"].items(), key=lambda kv: -kv[1]["seconds"])]
+    lines += ["{0:<24} count: {1}".format(k, v) for (k,v) in report["counters"].items()]
+    return "\n".join(lines)
+
+def printReport():
+    print(formatReport())
+
+# Write the report as JSON
+def exportReport(path):
+    with open(path, "w") as f:
+        json.dump(getReport(), f, indent=1)
@@ -0,0 +1,35 @@
+# This file maps material and product names to integer indices, built once per market and shared by its objects
+# Products and costumers keep their per material/product values in lists ordered by these indices
+class NameRegistry:
+    __slots__ = ("names", "indices")
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.indices = {k:i for (i,k) in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.indices
+
+    def indexOf(self, name):
+        return self.indices[name]
+
+    def nameOf(self, index):
+        return self.names[index]
+
+# Use a registry as is, or build one from a list of names
+def asRegistry(namesIn):
+    return namesIn if isinstance(namesIn, NameRegistry) else NameRegistry(namesIn)
+
+# Material and product registries of a market
+class MarketRegistry:
+    __slots__ = ("materials", "products")
+
+    def __init__(self, matNamesIn, prodNamesIn):
+        self.materials = asRegistry(matNamesIn)
+        self.products = asRegistry(prodNamesIn)
@@ -0,0 +1,90 @@
+# This file runs Monte Carlo scenarios of sell rounds for a production plan
+# Each replica gets its own random stream spawned from one SeedSequence, so results do not depend on the number of workers
+# Workers receive the costumer arrays once at start up, tasks only carry seeds
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import demandSide as dem
+import products as prod
+import planSolver as ps
+
+# Arrays shared by the replicas of a worker process, set by initScenarioWorker
+workerArrays = None
+
+# Worker initializer: keep budgets, probabilities, prices and stock for all tasks of this process
+def initScenarioWorker(budgets, probs, prices, stock):
+    global workerArrays
+    workerArrays = (budgets, probs, prices, stock)
+
+# Run one sell round per seed and return the sales of each product per replica
+def runReplicas(seedSeqs):
+    budgets, probs, prices, stock = workerArrays
+    sales = np.zeros((len(seedSeqs),len(prices)), dtype=np.int64)
+    for i, seedSeq in enumerate(seedSeqs):
+        bought, remBudgets = dem.buyProductsBatch(budgets, probs, prices, stock, np.random.default_rng(seedSeq))
+        sales[i] = bought.sum(axis=0)
+    return sales
+
+# Distribution of sales and profits over replicas (rows) for each product (columns)
+class ScenarioResult:
+
+    def __init__(self, productNames, produced, costsPerItem, prices, sales):
+        self.productNames = productNames
+        self.produced = produced
+        self.costsPerItem = costsPerItem
+        self.prices = prices
+        self.sales = sales
+        # Material costs are paid for everything produced, income only for sold items
+        self.profits = sales*prices - produced*costsPerItem
+
+    def getMeanSales(self):
+        return self.sales.mean(axis=0)
+
+    def getMeanProfits(self):
+        return self.profits.mean(axis=0)
+
+    # Total profit of the plan in each replica
+    def getTotalProfits(self):
+        return self.profits.sum(axis=1)
+
+    # Quantiles of the profit of each product (and of the total as the last column)
+    def getProfitQuantiles(self, quantiles=(0.05,0.5,0.95)):
+        return np.quantile(np.column_stack((self.profits,self.getTotalProfits())), quantiles, axis=0)
+
+    # Probability that the whole plan loses money
+    def getLossProbability(self):
+        return float(np.mean(self.getTotalProfits()<0))
+
+    # Print summary of the scenarios
+    def printInfo(self):
+        print("Scenario results over {0} replicas".format(len(self.sales)))
+        meanSales, meanProfits = self.getMeanSales(), self.getMeanProfits()
+        lowProfits, highProfits = self.getProfitQuantiles((0.05,0.95))
+        for j, name in enumerate(self.productNames):
+            print("Product: {0}, produced: {1:.0f}, mean sold: {2:.1f}, mean profit: {3:.2f}, 90% interval: [{4:.2f}, {5:.2f}]" \
+                .format(name, self.produced[j], meanSales[j], meanProfits[j], lowProfits[j], highProfits[j]))
+        print("Total mean profit: {0:.2f}, probability of loss: {1:.3f}".format(self.getTotalProfits().mean(), self.getLossProbability()))
+
+# Run nReplicas independent sell rounds of the given costumer population for prices and produced quantities
+# Products are sold as whole items, so the stock is the floor of the produced quantities
+# Every replica is a fresh round: costumers start from their total budgets, whatever an earlier sell round spent
+def runSellScenarios(population, prices, produced, costsPerItem, nReplicas, seed=None, nWorkers=None, replicasPerTask=8):
+    prices = np.asarray(prices, dtype=float)
+    produced = np.asarray(produced, dtype=float)
+    stock = np.floor(produced).astype(np.int64)
+    seedSeqs = np.random.SeedSequence(seed).spawn(nReplicas)
+    tasks = [seedSeqs[i:i+replicasPerTask] for i in range(0, nReplicas, replicasPerTask)]
+    initArgs = (population.totalBudgets, population.probs, prices, stock)
+    if nWorkers==1:
+        initScenarioWorker(*initArgs)
+        salesList = [runReplicas(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=nWorkers, initializer=initScenarioWorker, initargs=initArgs) as executor:
+            salesList = list(executor.map(runReplicas, tasks))
+    sales = np.concatenate(salesList) if salesList else np.zeros((0,len(prices)), dtype=np.int64)
+    return ScenarioResult(population.productNames, produced, np.asarray(costsPerItem, dtype=float), prices, sales)
+
+# Solve an investment and profit percentage plan for the market, then run sell scenarios for it
+def runPlanScenarios(prodList, matList, population, investments, profitPercentages, nReplicas, seed=None, nWorkers=None):
+    solution = ps.solveProduction(prod.BillOfMaterials(prodList, matList), investments)
+    prices = solution.costsPerItem*(1+np.asarray(profitPercentages, dtype=float)/100.0)
+    return runSellScenarios(population, prices, solution.produced, solution.costsPerItem, nReplicas, seed, nWorkers)
@@ -0,0 +1,86 @@
+# This file runs one sell round of a costumer population in shards on several worker processes
+# Costumers compete for the shared stock, so every shard gets a stock allocation and leftovers are reconciled in later passes
+# Ordering and fairness rule:
+#   - Shards are contiguous parts of the costumers still buying, in population order
+#   - Each product's stock (or leftover stock in later passes) is split between shards proportionally to their expected demand
+#     (remaining budget times renormalized affordable probabilities over price), with largest remainders rounded up, ties to lower shards
+#   - Within a shard, costumers buy as in demandSide.buyProductsBatch (stock conflicts resolved in population order)
+#   - Unsold allocations are pooled and split again between the costumers who can still buy, for at most maxPasses passes
+#   - A last serial pass lets the remaining costumers buy the remaining stock in population order
+# Each pass and shard draws from its own stream spawned from the seed, so results only depend on seed, nShards and maxPasses
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import demandSide as dem
+
+# Let the costumers of one shard buy from their stock allocation, returns their bought counts and remaining budgets
+def sellShard(budgets, probs, prices, stock, seedSeq, blockSampling=False):
+    engine = dem.buyProductsBlocks if blockSampling else dem.buyProductsBatch
+    return engine(budgets, probs, prices, stock, np.random.default_rng(seedSeq))
+
+# Expected number of items of each product bought by costumers with the given budgets and probabilities
+# Probabilities are renormalized over the affordable and in stock products, rows are costumers
+def expectedDemands(budgets, probs, prices, stock):
+    weights = probs * ((budgets[:,None]-prices)>=0) * (stock>0)
+    totWeights = weights.sum(axis=1, keepdims=True)
+    return (budgets[:,None]*weights/np.where(totWeights>0, totWeights, 1.0)) / prices
+
+# Split stock (nProducts,) between shards proportionally to demands (nShards, nProducts)
+# Shares are rounded down, the remaining items go to the largest remainders (ties to lower shards)
+# Products nobody wants are not allocated
+def allocateStock(stock, demands):
+    totDemands = demands.sum(axis=0)
+    shares = stock*demands/np.where(totDemands>0, totDemands, 1.0)
+    allocation = np.floor(shares).astype(np.int64)
+    remainders = np.where(totDemands>0, stock-allocation.sum(axis=0), 0)
+    order = np.argsort(-(shares-allocation), axis=0, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(len(demands))[:,None], axis=0)
+    return allocation + (ranks<remainders)
+
+# One sell round of all costumers with budgets and probs (nCostumers, nProducts) in nShards shards
+# Shards run in a process pool with nWorkers processes (all cores by default), or in this process if nWorkers is 1
+# An existing executor can be given to avoid starting processes for every round
+# If given, progress is called after every pass with the fraction of costumers done buying
+# Returns the bought counts (nCostumers, nProducts) and the remaining budgets, as demandSide.buyProductsBatch
+def sellSharded(budgets, probs, prices, stock, nShards, seed=None, nWorkers=None, maxPasses=3, blockSampling=False, progress=None, executor=None):
+    remBudgets = np.array(budgets, dtype=float)
+    probs = np.asarray(probs)
+    prices = np.asarray(prices, dtype=float)
+    stock = np.array(stock, dtype=np.int64)
+    bought = np.zeros(probs.shape, dtype=np.int32)
+    passSeeds = np.random.SeedSequence(seed).spawn(maxPasses+1)
+    active = np.flatnonzero(probs.sum(axis=1)>0)
+    ownExecutor = executor is None and nWorkers!=1
+    if ownExecutor:
+        executor = ProcessPoolExecutor(max_workers=min(nWorkers or os.cpu_count(), nShards))
+    try:
+        for passIndex in range(maxPasses):
+            demands = expectedDemands(remBudgets[active], probs[active], prices, stock)
+            # Costumers who cannot afford anything anymore leave the market
+            canBuy = demands.sum(axis=1)>0
+            active, demands = active[canBuy], demands[canBuy]
+            if active.size==0:
+                break
+            shards = np.array_split(np.arange(active.size), min(nShards, active.size))
+            allocation = allocateStock(stock, np.array([demands[s].sum(axis=0) for s in shards]))
+            tasks = [(remBudgets[active[s]], probs[active[s]], prices, allocation[k], seedSeq, blockSampling)
+                     for k, (s, seedSeq) in enumerate(zip(shards, passSeeds[passIndex].spawn(len(shards))))]
+            if executor is None:
+                results = [sellShard(*t) for t in tasks]
+            else:
+                results = [f.result() for f in [executor.submit(sellShard, *t) for t in tasks]]
+            for s, (shardBought, shardBudgets) in zip(shards, results):
+                bought[active[s]] += shardBought
+                remBudgets[active[s]] = shardBudgets
+                stock -= shardBought.sum(axis=0)
+            if progress is not None:
+                progress((passIndex+1)/(maxPasses+1))
+    finally:
+        if ownExecutor:
+            executor.shutdown()
+    # Last pass in population order with the leftover stock
+    if active.size>0 and stock.any():
+        lastBought, remBudgets[active] = sellShard(remBudgets[active], probs[active], prices, stock, passSeeds[maxPasses], blockSampling)
+        bought[active] += lastBought
+    return bought, remBudgets
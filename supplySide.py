@@ -1,6 +1,6 @@
 # This file handles the supply of raw materials
 import numpy as np
-import matplotlib.pyplot as plt
+import profiling as prof
 
 supSeed = 122807528840384100672342137672332423405
 supRng = np.random.default_rng(supSeed)
@@ -9,8 +9,17 @@ supRng = np.random.default_rng(supSeed)
 def genericSupplyFormula(supCoeff, supExp, supInter):
     return lambda price : supCoeff*(price**supExp)+supInter
 
+# Supply parameters of a list of materials as arrays (coefficients, exponents, intercepts)
+def getSupplyParArrays(matList):
+    return tuple(np.array(pars, dtype=float) for pars in zip(*[m.getSupplyPars() for m in matList]))
+
+# Vectorized generic supply formula: prices of all materials for their demands
+def supplyPrices(supCoeffs, supExps, supInters, demands):
+    return supCoeffs*np.power(demands,supExps)+supInters
+
 # Class for raw materials, contains supply curve, and hence a function to get price as based on demand
 class RawMaterial:
+    __slots__ = ("name", "demanded", "price", "totalPrice", "supCoeff", "supExp", "supInter", "curveCache")
     
     # number of raw material types
     nRawMaterials = 0
@@ -27,17 +36,19 @@ class RawMaterial:
         self.price = 0
         self.totalPrice = 0
     
-    # Update supply curve    
+    # Update supply curve, precomputed curves are invalidated
     def updateSupplyPars(self, supCoeffIn, supExpIn, supInterIn):
         self.supCoeff = supCoeffIn
         self.supExp = supExpIn
         self.supInter = supInterIn
+        self.curveCache = {}
         
-    # Randomly set supply curve
-    def setRandomSupplyPars(self):
-        supCoeff = float(supRng.normal(0.01,0.001,1))
-        supExp = float(supRng.normal(1.00,0.1,1))
-        supInter = float((0.05-0.01)*supRng.random() + 0.01)
+    # Randomly set supply curve (from supRng unless another generator is given)
+    def setRandomSupplyPars(self, rng=None):
+        rng = supRng if rng is None else rng
+        supCoeff = float(rng.normal(0.01,0.001))
+        supExp = float(rng.normal(1.00,0.1))
+        supInter = float((0.05-0.01)*rng.random() + 0.01)
         self.updateSupplyPars(supCoeff, supExp, supInter)
     
     # Returns supply parameters
@@ -48,12 +59,29 @@ class RawMaterial:
     def getSupplyFormula(self):
         return genericSupplyFormula(self.supCoeff, self.supExp, self.supInter)
     
-    # Generate supply formula from parameters and get price from demand
+    # Get price from demand using the supply parameters
     def getPriceFromDemand(self, demand):
-        supplyFormula = genericSupplyFormula(self.supCoeff, self.supExp, self.supInter)
-        self.price = supplyFormula(demand)
+        prof.count("materialPriceCalls")
+        self.price = self.supCoeff*(demand**self.supExp)+self.supInter
         return self.price
     
+    # Array in/array out prices for given demands, without changing the current price
+    def getPricesFromDemands(self, demands):
+        prof.count("materialPriceCalls")
+        return self.supCoeff*np.power(np.asarray(demands,dtype=float),self.supExp)+self.supInter
+    
+    # Inverse of the supply curve: demands that would result in the given prices (0 below the intercept price)
+    def getDemandsFromPrices(self, prices):
+        return np.power(np.maximum(np.asarray(prices,dtype=float)-self.supInter,0)/self.supCoeff,1.0/self.supExp)
+    
+    # Precomputed supply curve (demands and prices), cached until the supply parameters are updated
+    def getSupplyCurve(self, maxDemand=10000, nPoints=10000):
+        key = (maxDemand, nPoints)
+        if key not in self.curveCache:
+            testDemands = np.linspace(0,maxDemand,nPoints)
+            self.curveCache[key] = (testDemands, self.getPricesFromDemands(testDemands))
+        return self.curveCache[key]
+    
     # Use self.demanded as input for supply Formula
     def getPrice(self):
         return self.getPriceFromDemand(self.demanded)
@@ -75,22 +103,25 @@ class RawMaterial:
         
     # Make a standard supply curve graph
     def plotSupplyCurve(self):
-        # Save current demand and price to be restored later
-        demandedSave = self.demanded
-        priceSave = self.price
-        # Loop over some example demands and calculate the corresponding prices
-        testDemands = np.linspace(0,10000,10000)
-        testPrices = [self.getPriceFromDemand(d) for d in testDemands]
-        # Restore demand and price
-        self.demanded = demandedSave
-        self.price = priceSave
-        # Prepare plot
-        f, ax = plt.subplots()
-        ax.plot(testDemands,testPrices)
-        ax.set_title("{0} supply curve".format(self.name))
-        ax.set_xlabel("Demanded Quantity")
-        ax.set_ylabel("Price per Item ($)")
-        plt.axvline(x=self.demanded, color='red', linestyle='--', label='Demand')
-        plt.axhline(y=self.price, color='red', linestyle='--', label='Price')
-        #plt.grid()
-        return f, ax
\ No newline at end of file
+        return plotSupplyCurveFromPars(self.name, self.getSupplyPars(), self.demanded, self.price, self.getSupplyCurve())
+
+# Supply curve graph from supply parameters (coefficient, exponent, intercept), demand and price, does not read any material
+# curve (demands, prices) is computed from the parameters unless given
+def plotSupplyCurveFromPars(name, supPars, demanded, price, curve=None, maxDemand=10000, nPoints=10000):
+    # Plotting is only imported when needed, so headless use does not load matplotlib
+    import matplotlib.pyplot as plt
+    # Example demands and the corresponding prices
+    if curve is None:
+        testDemands = np.linspace(0,maxDemand,nPoints)
+        curve = (testDemands, supplyPrices(*supPars, testDemands))
+    testDemands, testPrices = curve
+    # Prepare plot
+    f, ax = plt.subplots()
+    ax.plot(testDemands,testPrices)
+    ax.set_title("{0} supply curve".format(name))
+    ax.set_xlabel("Demanded Quantity")
+    ax.set_ylabel("Price per Item ($)")
+    plt.axvline(x=demanded, color='red', linestyle='--', label='Demand')
+    plt.axhline(y=price, color='red', linestyle='--', label='Price')
+    #plt.grid()
+    return f, ax
\ No newline at end of file
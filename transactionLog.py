@@ -0,0 +1,86 @@
+# This file writes individual purchases (transactions) of sell rounds to disk with bounded memory
+# Transactions are buffered in fixed size numpy columns and appended chunk by chunk to one raw binary file per column
+# Costumers can be sampled: with sampleRate < 1 only a fixed subset of costumers (chosen by a hash of their index) is logged,
+# so the full purchase history of every sampled costumer is kept
+import json
+import os
+import numpy as np
+
+# Columns of the log and their types
+transactionColumns = {"costumer":np.int64, "product":np.int32, "price":np.float64, "remBudget":np.float32, "round":np.int32}
+
+# Deterministic pseudo random number in [0,1) for each costumer index, used to pick sampled costumers
+def costumerSampleKey(costumers):
+    return ((np.asarray(costumers, dtype=np.uint64)*np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(11)).astype(np.float64) / 2.0**53
+
+class TransactionLog:
+
+    def __init__(self, path, sampleRate=1.0, chunkSize=1000000):
+        self.path = path
+        self.sampleRate = sampleRate
+        self.chunkSize = chunkSize
+        self.round = 0
+        self.nWritten = 0
+        self.nBuffered = 0
+        self.buffers = {k:np.empty(chunkSize, dtype=t) for (k,t) in transactionColumns.items()}
+        os.makedirs(path, exist_ok=True)
+        self.files = {k:open(os.path.join(path, k+".bin"), "wb") for k in transactionColumns}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Sell round number written with the following transactions
+    def setRound(self, roundIn):
+        self.round = roundIn
+
+    # Add transactions of one purchasing round: buying costumer indices, product indices, prices and remaining budgets
+    def record(self, costumers, products, prices, remBudgets):
+        if self.sampleRate<1.0:
+            keep = costumerSampleKey(costumers) < self.sampleRate
+            costumers, products, prices, remBudgets = costumers[keep], products[keep], prices[keep], remBudgets[keep]
+        start = 0
+        while start<len(costumers):
+            n = min(len(costumers)-start, self.chunkSize-self.nBuffered)
+            end = self.nBuffered+n
+            self.buffers["costumer"][self.nBuffered:end] = costumers[start:start+n]
+            self.buffers["product"][self.nBuffered:end] = products[start:start+n]
+            self.buffers["price"][self.nBuffered:end] = prices[start:start+n]
+            self.buffers["remBudget"][self.nBuffered:end] = remBudgets[start:start+n]
+            self.buffers["round"][self.nBuffered:end] = self.round
+            self.nBuffered = end
+            start += n
+            if self.nBuffered==self.chunkSize:
+                self.flush()
+
+    # Append buffered transactions to the column files
+    def flush(self):
+        for k, f in self.files.items():
+            self.buffers[k][:self.nBuffered].tofile(f)
+            f.flush()
+        self.nWritten += self.nBuffered
+        self.nBuffered = 0
+        self.writeMeta()
+
+    def writeMeta(self):
+        meta = {"nTransactions":self.nWritten, "sampleRate":self.sampleRate,
+                "columns":{k:np.dtype(t).str for (k,t) in transactionColumns.items()}}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    # Write what is left in the buffers and close the files
+    def close(self):
+        if self.files:
+            self.flush()
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+
+# Read a transaction log as memory mapped columns (dict of arrays)
+def readTransactionLog(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return {k:np.memmap(os.path.join(path, k+".bin"), dtype=np.dtype(t), mode="r", shape=(meta["nTransactions"],))
+            if meta["nTransactions"]>0 else np.zeros(0, dtype=np.dtype(t)) for (k,t) in meta["columns"].items()}